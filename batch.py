@@ -0,0 +1,116 @@
+"""Headless triangulation of sessions without Qt
+
+Pixel files are tab-separated text with a header and `datetime`, `x`, `y`
+columns, one file per camera. Timestamps observed by at least two cameras are
+triangulated. Pixels are expected in undistorted image coordinates, the same
+as clicks in the GUI, or with `--distorted` in raw video coordinates, whose
+rays are looked up in per-pixel tables (see ray_lut.py).
+
+    python batch.py session.json --points cam1.txt cam2.txt -o track.txt
+    python batch.py sessions/*.json --jobs 8
+    python batch.py session.json --uncertainty --pixel-sigma 0.5
+    python batch.py session.json --distorted
+"""
+
+import argparse
+import csv
+from collections import Counter
+from collections.abc import Sequence
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+from ray_lut import load_ray_tables
+from session import HEADERS, Session
+from uncertainty import UNCERTAINTY_HEADERS, NoiseModel, UncertaintyEstimator
+
+
+def read_pixels(file_path: str) -> dict[datetime, tuple[float, float]]:
+    with open(file_path, newline='') as f:
+        r = csv.reader(f, delimiter='\t')
+        next(r)  # Skip headers
+        return {datetime.fromisoformat(dt): (float(x), float(y)) for dt, x, y in r}
+
+
+def process_session(session_path: str, points_paths: Sequence[str] | None, output_path: str, cam_keys=None, chunk_size=10_000,
+                    noise: NoiseModel | None = None, distorted=False) -> int:
+    """Triangulate all observations of a session and write them like `Controller.export_data`.
+
+    By default pixel files are `<session>_<cam>.txt` next to the session file.
+    If `noise` is given, uncertainty columns are added. With `distorted`,
+    pixels are in raw video coordinates and ray tables of the cameras are
+    built if not cached. Returns number of written rows. Safe to run in a
+    process pool.
+    """
+    session = Session(session_path, cam_keys)
+    if distorted:
+        load_ray_tables(session)
+    points_paths = points_paths or _default_points(Path(session_path), session.cam_keys)
+    pixels = [read_pixels(path) for path in points_paths]
+    counts = Counter(dt for p in pixels for dt in p)
+    timestamps = sorted(dt for dt, count in counts.items() if count >= 2)
+    missing = np.nan, np.nan
+    estimator = UncertaintyEstimator(session.triangulator, noise) if noise is not None else None
+
+    with open(output_path, 'w', newline='') as f:
+        w = csv.writer(f, delimiter='\t')
+        w.writerow(HEADERS + UNCERTAINTY_HEADERS if estimator else HEADERS)
+        for i in range(0, len(timestamps), chunk_size):
+            chunk = timestamps[i:i + chunk_size]
+            chunk_pixels = [np.array([p.get(dt, missing) for dt in chunk]) for p in pixels]
+            enu, _ = session.triangulator.triangulate_batch(*chunk_pixels, distorted=distorted)
+            geodetic = session.local_frame.enu2geodetic(enu)
+            if estimator is None:
+                w.writerows((dt, *e, *g) for dt, e, g in zip(chunk, enu.tolist(), geodetic.tolist()))
+            else:
+                if distorted:
+                    # Noise model is defined in undistorted pixels
+                    chunk_pixels = [cam.ray_table.undistort_points(p, cam.mtx) for cam, p in zip(session.cams, chunk_pixels)]
+                uncertainty = estimator.estimate(*chunk_pixels).tolist()
+                w.writerows((dt, *e, *g, *u) for dt, e, g, u in zip(chunk, enu.tolist(), geodetic.tolist(), uncertainty))
+
+    return len(timestamps)
+
+
+def _default_points(session_path: Path, cam_keys) -> list[str]:
+    return [str(session_path.with_name(f'{session_path.stem}_{cam}.txt')) for cam in cam_keys]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('sessions', nargs='+', type=Path, help='session JSON files')
+    parser.add_argument('--points', nargs='+', help='pixel file per camera (single session only), '
+                        'by default <session>_<cam>.txt next to the session file')
+    parser.add_argument('-o', '--output', help='output file (single session only), by default <session>.txt')
+    parser.add_argument('--cams', nargs='+', help='camera keys in the session file, by default its `cams` list or cam1 cam2')
+    parser.add_argument('--chunk-size', type=int, default=10_000)
+    parser.add_argument('-j', '--jobs', type=int, default=1, help='number of worker processes')
+    parser.add_argument('--distorted', action='store_true', help='pixels are in raw video coordinates')
+    uncertainty = parser.add_argument_group('uncertainty', 'Monte Carlo estimate of covariance of every point')
+    uncertainty.add_argument('--uncertainty', action='store_true', help='add miss distance and covariance columns')
+    uncertainty.add_argument('--pixel-sigma', type=float, default=NoiseModel.pixel_sigma, help='clicked pixels noise, px')
+    uncertainty.add_argument('--anchor-sigma', type=float, default=NoiseModel.anchor_sigma, help='anchor pixels noise, px')
+    uncertainty.add_argument('--position-sigma', type=float, default=NoiseModel.position_sigma, help='camera position noise, m')
+    uncertainty.add_argument('--samples', type=int, default=NoiseModel.samples)
+    args = parser.parse_args()
+
+    if len(args.sessions) > 1 and (args.points or args.output):
+        parser.error('--points and --output can only be used with a single session')
+
+    noise = NoiseModel(args.pixel_sigma, args.anchor_sigma, args.position_sigma, args.samples) if args.uncertainty else None
+    jobs = []
+    for session_path in args.sessions:
+        points = args.points
+        output = args.output or str(session_path.with_suffix('.txt'))
+        jobs.append((str(session_path), points, output, args.cams, args.chunk_size, noise, args.distorted))
+
+    with ProcessPoolExecutor(args.jobs) as pool:
+        futures = [pool.submit(process_session, *job) for job in jobs]
+        for (session_path, _, output, *_), future in zip(jobs, futures):
+            print(f'{session_path}: {future.result()} points -> {output}')
+
+
+if __name__ == '__main__':
+    main()
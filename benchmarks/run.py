@@ -0,0 +1,228 @@
+"""Benchmarks of triangulation and frame processing hot paths
+
+    python -m benchmarks.run -o bench.json
+    python -m benchmarks.run -o new.json --compare bench.json
+    python -m benchmarks.run --quick --only triangulation
+
+Every benchmark reports the median time of a call in seconds and, where it
+makes sense, the throughput in items per second. `--compare` prints the ratio
+of new to old median times, values above 1 are regressions.
+"""
+
+import argparse
+import json
+import platform
+import statistics
+import tempfile
+import time
+from collections.abc import Callable
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import cv2 as cv
+import numpy as np
+import pymap3d as pm
+
+from geodesy import LocalFrame
+from ray_lut import RayTable
+from session import write_data
+from track_store import TrackStore
+from triangulation import Triangulator
+from uncertainty import NoiseModel, UncertaintyEstimator
+from undistortion import ImageUndistorter
+
+from .scene import make_scene
+
+
+def measure(func: Callable, repeat: int, min_time=0.2) -> dict:
+    """Median and best time of `func` over `repeat` runs, each run looping for at least `min_time`"""
+    func()  # Warm up
+    loops = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(loops):
+            func()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time or loops >= 1_000_000:
+            break
+        loops *= 10
+
+    times = [elapsed / loops]
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        for _ in range(loops):
+            func()
+        times.append((time.perf_counter() - start) / loops)
+    return {'median': statistics.median(times), 'min': min(times), 'loops': loops, 'repeat': repeat}
+
+
+def bench_triangulation(sizes, repeat) -> dict:
+    results = {}
+    for n in sizes:
+        scene = make_scene(n)
+        cam1, cam2 = scene.cameras()
+        triangulator = Triangulator(cam1, cam2, *scene.cams_world)
+        pix1, pix2 = scene.project(0, scene.points_world), scene.project(1, scene.points_world)
+
+        world, _ = triangulator.triangulate_batch(pix1, pix2)
+        error = float(np.abs(world - scene.points_world).max())
+
+        # Scalar path is too slow for large sizes
+        if n <= 10_000:
+            results[f'scalar/{n}'] = measure(lambda: [triangulator.triangulate(a, b) for a, b in zip(pix1, pix2)], repeat)
+        results[f'batch/{n}'] = measure(lambda: triangulator.triangulate_batch(pix1, pix2), repeat)
+        results[f'batch/{n}']['max_error_m'] = error
+
+        multi = scene.triangulator()
+        results[f'multi/{n}'] = measure(lambda: multi.triangulate_batch(pix1, pix2), repeat)
+        for key in f'scalar/{n}', f'batch/{n}', f'multi/{n}':
+            if key in results:
+                results[key]['items_per_s'] = n / results[key]['median']
+    return results
+
+
+def bench_anchor_update(repeat) -> dict:
+    scene = make_scene(0)
+    cam = scene.cameras()[0]
+    pix = scene.project(0, scene.anchors_world)[1]
+    return {'update_anchor_point': measure(lambda: cam.update_anchor_point(1, pix), repeat)}
+
+
+def bench_undistortion(repeat) -> dict:
+    results = {}
+    for name, size in ('1080p', (1920, 1080)), ('4k', (3840, 2160)):
+        scene = make_scene(0, image_size=size)
+        rng = np.random.default_rng(0)
+        image = rng.integers(0, 256, (size[1], size[0], 3), dtype=np.uint8)
+        undistorter = ImageUndistorter(scene.cam_mtx, scene.distortion_coeffs)
+        results[f'cv.undistort/{name}'] = measure(lambda: cv.undistort(image, scene.cam_mtx, scene.distortion_coeffs), repeat)
+        results[f'undistort/{name}'] = measure(lambda: undistorter.undistort(image), repeat)
+        dst = np.empty(undistorter.output_shape(image), np.uint8)
+        results[f'undistort_dst/{name}'] = measure(lambda: undistorter.undistort(image, dst), repeat)
+        nearest = ImageUndistorter(scene.cam_mtx, scene.distortion_coeffs, interpolation=cv.INTER_NEAREST)
+        results[f'undistort_nearest/{name}'] = measure(lambda: nearest.undistort(image), repeat)
+        for key in f'cv.undistort/{name}', f'undistort/{name}', f'undistort_dst/{name}', f'undistort_nearest/{name}':
+            results[key]['items_per_s'] = 1 / results[key]['median']
+    return results
+
+
+def bench_rays(sizes, repeat) -> dict:
+    """Undistorted pixels of raw pixels by iterative undistortion (default and converged) and by gathering from a ray table"""
+    scene = make_scene(max(sizes))
+    undistorter = ImageUndistorter(scene.cam_mtx, scene.distortion_coeffs)
+    raw = undistorter.distort_points(scene.project(0, scene.points_world))
+    results = {'build/1080p': measure(lambda: RayTable.build(scene.cam_mtx, scene.distortion_coeffs, scene.image_size), 1)}
+    table = RayTable.build(scene.cam_mtx, scene.distortion_coeffs, scene.image_size)
+    # Same as the table is built with
+    criteria = cv.TERM_CRITERIA_COUNT | cv.TERM_CRITERIA_EPS, 20, 1e-12
+    for n in sizes:
+        results[f'undistort_points/{n}'] = measure(lambda: undistorter.undistort_points(raw[:n]), repeat)
+        results[f'converged/{n}'] = measure(lambda: cv.undistortPointsIter(
+            raw[:n].reshape(-1, 1, 2), scene.cam_mtx, scene.distortion_coeffs, None, scene.cam_mtx, criteria), repeat)
+        results[f'table/{n}'] = measure(lambda: table.undistort_points(raw[:n], scene.cam_mtx), repeat)
+        for key in f'undistort_points/{n}', f'converged/{n}', f'table/{n}':
+            results[key]['items_per_s'] = n / results[key]['median']
+    return results
+
+
+def bench_geodetic(sizes, repeat) -> dict:
+    results = {}
+    scene = make_scene(max(sizes))
+    frame = LocalFrame(scene.origin_geodetic)
+    for n in sizes:
+        enu = scene.points_world[:n]
+        if n <= 10_000:
+            results[f'scalar_enu2geodetic/{n}'] = measure(lambda: [pm.enu2geodetic(*e, *scene.origin_geodetic) for e in enu], repeat)
+            results[f'scalar_enu2geodetic/{n}']['items_per_s'] = n / results[f'scalar_enu2geodetic/{n}']['median']
+        results[f'enu2geodetic/{n}'] = measure(lambda: frame.enu2geodetic(enu), repeat)
+        results[f'enu2geodetic/{n}']['items_per_s'] = n / results[f'enu2geodetic/{n}']['median']
+    return results
+
+
+def bench_uncertainty(sizes, repeat) -> dict:
+    results = {}
+    scene = make_scene(max(sizes))
+    pix = [scene.project(0, scene.points_world), scene.project(1, scene.points_world)]
+    estimator = UncertaintyEstimator(scene.triangulator(), NoiseModel())
+    for n in sizes:
+        results[f'monte_carlo/{n}'] = measure(lambda: estimator.estimate(pix[0][:n], pix[1][:n]), repeat)
+        results[f'monte_carlo/{n}']['items_per_s'] = n / results[f'monte_carlo/{n}']['median']
+        results[f'monte_carlo/{n}']['samples'] = estimator.noise.samples
+    return results
+
+
+def bench_export(sizes, repeat) -> dict:
+    results = {}
+    scene = make_scene(max(sizes))
+    frame = LocalFrame(scene.origin_geodetic)
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in sizes:
+            store = TrackStore(2, capacity=n)
+            start = datetime(2024, 1, 1)
+            geodetic = frame.enu2geodetic(scene.points_world[:n])
+            for i in range(n):
+                store.set(start + timedelta(milliseconds=40 * i), [0.0] * 4, scene.points_world[i], geodetic[i])
+            file_path = Path(tmp) / 'export.txt'
+            results[f'export_data/{n}'] = measure(lambda: write_data(file_path, store.rows()), repeat, min_time=0)
+            results[f'export_data/{n}']['items_per_s'] = n / results[f'export_data/{n}']['median']
+    return results
+
+
+def compare(new: dict, old: dict):
+    print(f'{"benchmark":<45} {"old":>12} {"new":>12} {"ratio":>8}')
+    for group, benchmarks in new['results'].items():
+        for name, result in benchmarks.items():
+            previous = old['results'].get(group, {}).get(name)
+            if previous is None:
+                continue
+            ratio = result['median'] / previous['median']
+            print(f'{group + "/" + name:<45} {previous["median"]:>12.3e} {result["median"]:>12.3e} {ratio:>8.2f}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-o', '--output', help='write results as JSON to this file')
+    parser.add_argument('--compare', help='JSON results of a previous run')
+    parser.add_argument('--only', nargs='+', help='run only these benchmark groups')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--quick', action='store_true', help='smaller sizes for a fast sanity run')
+    args = parser.parse_args()
+
+    sizes = [1_000, 10_000] if args.quick else [1_000, 10_000, 100_000, 1_000_000]
+    groups = {
+        'triangulation': lambda: bench_triangulation(sizes[:2] if args.quick else sizes[:3], args.repeat),
+        'anchor_update': lambda: bench_anchor_update(args.repeat),
+        'undistortion': lambda: bench_undistortion(args.repeat),
+        'rays': lambda: bench_rays(sizes[:3], args.repeat),
+        'geodetic': lambda: bench_geodetic(sizes, args.repeat),
+        'uncertainty': lambda: bench_uncertainty([1, 1_000] if args.quick else [1, 1_000, 10_000], min(args.repeat, 3)),
+        'export': lambda: bench_export(sizes, min(args.repeat, 3)),
+    }
+
+    report = {
+        'created': datetime.now().isoformat(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'opencv': cv.__version__,
+        'machine': platform.machine(),
+        'results': {},
+    }
+    for name, bench in groups.items():
+        if args.only and name not in args.only:
+            continue
+        print(f'Running {name}...')
+        report['results'][name] = bench()
+        for key, result in report['results'][name].items():
+            rate = f'{result["items_per_s"]:>14,.0f}/s' if 'items_per_s' in result else ''
+            print(f'  {key:<35} {result["median"]:.3e} s {rate}')
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(report, json.load(f))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+"""Synthetic scene with known cameras, anchors and ground truth points"""
+
+from dataclasses import dataclass
+
+import numpy as np
+
+from geodesy import LocalFrame
+from triangulation import Camera, MultiTriangulator
+
+
+def look_at(direction) -> np.ndarray:
+    """Camera to world rotation of a camera looking along `direction` (ENU), image y axis pointing down"""
+    z = direction / np.linalg.norm(direction)
+    x = np.cross(z, [0.0, 0.0, 1.0])
+    x /= np.linalg.norm(x)
+    y = np.cross(z, x)
+    return np.column_stack([x, y, z])
+
+
+@dataclass
+class Scene:
+    origin_geodetic: tuple[float, float, float]
+    cam_mtx: np.ndarray
+    distortion_coeffs: np.ndarray
+    image_size: tuple[int, int]
+    cams_world: np.ndarray  # (C, 3) ENU
+    rotations_cam2world: list[np.ndarray]
+    anchors_world: np.ndarray  # (2, 3) ENU
+    points_world: np.ndarray  # (N, 3) ENU ground truth
+
+    @property
+    def local_frame(self) -> LocalFrame:
+        return LocalFrame(self.origin_geodetic)
+
+    def project(self, cam: int, points_world) -> np.ndarray:
+        """(N, 3) ENU points -> (N, 2) undistorted pixels of camera `cam`"""
+        cam_points = (np.asarray(points_world) - self.cams_world[cam]) @ self.rotations_cam2world[cam]
+        pix = cam_points @ self.cam_mtx.T
+        return pix[:, :2] / pix[:, 2:]
+
+    def cameras(self) -> list[Camera]:
+        cams = []
+        for i, cam_world in enumerate(self.cams_world):
+            # Anchors are given relative to each camera, as in the session file
+            anchors_world = list(self.anchors_world - cam_world)
+            cams.append(Camera(self.cam_mtx, anchors_world, list(self.project(i, self.anchors_world))))
+        return cams
+
+    def triangulator(self) -> MultiTriangulator:
+        return MultiTriangulator(self.cameras(), self.cams_world)
+
+    def session_data(self, videos: list[str]) -> dict:
+        """Session file contents for this scene"""
+        frame = self.local_frame
+        anchors_geodetic = frame.enu2geodetic(self.anchors_world).tolist()
+        data = {'cams': [f'cam{i + 1}' for i in range(len(self.cams_world))]}
+        data['cp1_geodetic'], data['cp2_geodetic'] = anchors_geodetic
+        for i, (key, video) in enumerate(zip(data['cams'], videos)):
+            anchors_pix = self.project(i, self.anchors_world).tolist()
+            data[key] = {
+                'file': video,
+                'fx': self.cam_mtx[0, 0], 'fy': self.cam_mtx[1, 1],
+                'cx': self.cam_mtx[0, 2], 'cy': self.cam_mtx[1, 2],
+                'distortion_coeffs': self.distortion_coeffs.tolist(),
+                'cam_geodetic': frame.enu2geodetic(self.cams_world[i]).tolist(),
+                'cp1_pix': anchors_pix[0],
+                'cp2_pix': anchors_pix[1],
+            }
+        return data
+
+
+def make_scene(n_points=1000, n_cams=2, image_size=(1920, 1080), seed=0) -> Scene:
+    """Cameras on an arc around a 100 m wide area with random points in it"""
+    rng = np.random.default_rng(seed)
+    w, h = image_size
+    f = 0.8 * w
+    cam_mtx = np.array([
+        [f, 0, w / 2],
+        [0, f, h / 2],
+        [0, 0,     1],
+    ])
+    target = np.array([0.0, 300.0, 20.0])
+
+    angles = np.linspace(-0.4, 0.4, n_cams)
+    cams_world = np.column_stack([300 * np.sin(angles), 300 * (1 - np.cos(angles)), np.full(n_cams, 2.0)])
+    cams_world -= cams_world[0]  # First camera is the ENU origin
+    rotations = [look_at(target - cam) for cam in cams_world]
+
+    return Scene(
+        origin_geodetic=(55.75, 37.62, 150.0),
+        cam_mtx=cam_mtx,
+        distortion_coeffs=np.array([-0.2, 0.05, 0.0, 0.0, 0.0]),
+        image_size=image_size,
+        cams_world=cams_world,
+        rotations_cam2world=rotations,
+        anchors_world=target + np.array([[-40.0, 10.0, 0.0], [35.0, -5.0, 15.0]]),
+        points_world=target + rng.uniform([-50, -50, -15], [50, 50, 15], (n_points, 3)),
+    )
@@ -1,28 +1,73 @@
-import csv
-import json
 from datetime import datetime
+from pathlib import Path
 
 import numpy as np
-import pymap3d as pm
-from PySide6.QtCore import QFileInfo, QPointF
+from PySide6.QtCore import QFileInfo, QPointF, QTimer
 from PySide6.QtWidgets import QFileDialog
 
-from triangulation import Camera, Triangulator
+from correspondence import Match
+from session import HEADERS, write_data
+from track_store import TrackStore
 from ui.main_window import MainWindow
-from undistortion import ImageUndistorter
+from ui.matching_worker import MatchingWorker
+from ui.session_loader import LoadedSession, SessionLoader
+from ui.tracking_worker import TrackingWorker
+from uncertainty import UNCERTAINTY_HEADERS, NoiseModel, UncertaintyEstimator
 
 
 class Controller:
     """This class is responsible for communication between UI and Math"""
-    def __init__(self, window: MainWindow, cam_keys) -> None:
+    def __init__(self, window: MainWindow, cam_keys=None) -> None:
         self.window = window
+        # Keys to load, None for the `cams` list of the session file
+        self.requested_cam_keys = cam_keys
         self.cam_keys = cam_keys
-        self.triangulated_frames: dict[datetime, tuple] = {}
-
-        window.both_frames_clicked.connect(self.triangulate_frame)
+        # Triangulated frames, autosaved next to the session file
+        self.track: TrackStore | None = None
+        self.autosave_interval = 1000  # in milliseconds
+        self._autosave_timer = QTimer(singleShot=True)
+        self._autosave_timer.timeout.connect(self.save_track)
+
+        # Anchor edits re-triangulate all stored points once no new edit arrives within the delay
+        self.retriangulation_delay = 0  # in milliseconds
+        self._retriangulation_timer = QTimer(singleShot=True)
+        self._retriangulation_timer.timeout.connect(self.retriangulate_all)
+
+        window.all_frames_clicked.connect(self._on_all_frames_clicked)
         window.ui.action_open_file.triggered.connect(self.load_file_gui)
         window.ui.action_export_data.triggered.connect(self.export_data_gui)
         window.anchor_clicked.connect(self.update_anchor_point)
+        window.ui.action_undistort_frames.toggled.connect(self.set_undistort_frames)
+        self.undistort_frames = window.ui.action_undistort_frames.isChecked()
+
+        # Optical flow tracking of clicked points
+        self.tracking_max_steps = 1000  # in each direction
+        self._tracking_worker = TrackingWorker()
+        self._tracking_worker.point_tracked.connect(self._on_point_tracked)
+        self._tracking_worker.finished.connect(lambda reason: window.ui.statusbar.showMessage(f'Tracking stopped: {reason}'))
+        window.ui.action_track_points.toggled.connect(lambda enabled: enabled or self._tracking_worker.cancel())
+        window.closed.connect(self._tracking_worker.stop)
+        window.closed.connect(self.save_track)
+
+        # A point clicked in one view is searched along its epipolar line in the other one
+        self._matching_worker = MatchingWorker()
+        self._matching_worker.matched.connect(self._on_match_found)
+        self._matching_worker.failed.connect(lambda reason: window.ui.statusbar.showMessage(f'No match proposed: {reason}'))
+        window.point_clicked.connect(self._on_point_clicked)
+        window.closed.connect(self._matching_worker.stop)
+
+        # Monte Carlo uncertainty of every triangulated point
+        self.noise = NoiseModel()
+        self.uncertainty: UncertaintyEstimator | None = None
+        self.estimate_uncertainty = window.ui.action_estimate_uncertainty.isChecked()
+        window.ui.action_estimate_uncertainty.toggled.connect(self.set_estimate_uncertainty)
+
+        # Sessions are loaded in background, videos are opened once loading is done
+        self.session_loader = SessionLoader()
+        self.session_loader.progress.connect(window.show_progress)
+        self.session_loader.loaded.connect(self._on_session_loaded)
+        self.session_loader.failed.connect(self._on_session_failed)
+        window.closed.connect(self.session_loader.stop)
 
     def load_file_gui(self):
         file_path, _ = QFileDialog.getOpenFileName(self.window, filter='JSON (*.json)')
@@ -30,63 +75,154 @@ class Controller:
             self.load_file(file_path)
 
     def load_file(self, file_path: str):
-        # Clear previous data
-        self.triangulated_frames.clear()
-
-        with open(file_path) as f:
-            self.data: dict = json.load(f)
-        cp1_geodetic = self.data['cp1_geodetic']
-        cp2_geodetic = self.data['cp2_geodetic']
-
-        self.cams: list[Camera] = []
-        videos: list[str] = []
-        undistorters: list[ImageUndistorter] = []
-        for cam in self.cam_keys:
-            video = self.data[cam]['file']
-            videos.append(video)
-
-            # Form matrix of intrinsic parameters
-            fx = self.data[cam]['fx']
-            fy = self.data[cam]['fy']
-            cx = self.data[cam]['cx']
-            cy = self.data[cam]['cy']
-            cam_mtx = np.array([
-                [fx,  0, cx],
-                [ 0, fy, cy],
-                [ 0,  0,  1],
-            ])
-
-            distortion_coeffs = np.array(self.data[cam]['distortion_coeffs'])
-            undistorter = ImageUndistorter(cam_mtx, distortion_coeffs)
-            undistorters.append(undistorter)
-
-            cam_geodetic = self.data[cam]['cam_geodetic']
-            # TODO: add zero initialization if keys don't exist and maybe notify user!
-            cp1_pix = self.data[cam]['cp1_pix']
-            cp2_pix = self.data[cam]['cp2_pix']
-            cp1_world = np.array(pm.geodetic2enu(*cp1_geodetic, *cam_geodetic))
-            cp2_world = np.array(pm.geodetic2enu(*cp2_geodetic, *cam_geodetic))
-
-            camera = Camera(undistorter.mtx, [cp1_world, cp2_world], [cp1_pix, cp2_pix])
-            self.cams.append(camera)
-
-        self.file_info = QFileInfo(file_path)
-        videos = [f'{self.file_info.dir().path()}/{video}' for video in videos]
-        undistorters_callbacks = [x.undistort for x in undistorters]
-        
-        cam1_world = np.array([0.0, 0.0, 0.0])
-        cam2_world = pm.geodetic2enu(*self.data['cam2']['cam_geodetic'], *self.data['cam1']['cam_geodetic'])
-        self.triangulator = Triangulator(*self.cams, cam1_world, cam2_world)
-
-        self.window.open_files(videos, undistorters_callbacks)
-
-    def triangulate_frame(self, frame_datetime: datetime, pix1: QPointF, pix2: QPointF):
-        pix1 = pix1.toTuple()
-        pix2 = pix2.toTuple()
-        enu = self.triangulator.triangulate(pix1, pix2)
-        geodetic = np.array(pm.enu2geodetic(*enu, *self.data['cam1']['cam_geodetic']))
-        self.triangulated_frames[frame_datetime] = *enu.tolist(), *geodetic.tolist()
-        print(frame_datetime, pix1, pix2, enu.tolist(), geodetic.tolist())
+        """Start loading the session, videos are opened by `_on_session_loaded`"""
+        # Save previous data
+        self._tracking_worker.cancel()
+        self._matching_worker.cancel()
+        self.save_track()
+        self.session_loader.load(file_path, self.requested_cam_keys)
+
+    def _on_session_loaded(self, loaded: LoadedSession):
+        self.session = loaded.session
+        self.cam_keys = self.session.cam_keys
+        # Saved on load, released before the same directory may be moved aside
+        self.track = None
+        self.track, backup = self._open_track(self.session.file_path.with_suffix('.track'))
+        self.data = self.session.data
+        self.cams = self.session.cams
+        self.triangulator = self.session.triangulator
+        self.uncertainty = UncertaintyEstimator(self.triangulator, self.noise)
+
+        self.file_info = QFileInfo(str(self.session.file_path))
+        undistorters_callbacks = [x.undistort for x in self.session.undistorters]
+        # Pre-rendered undistorted videos, see proxy.py
+        self.window.open_files(self.session.videos, undistorters_callbacks, loaded.proxies, loaded.frame_indexes)
+        message = f'Loaded {self.file_info.fileName()}'
+        if backup is not None:
+            message += f', track of a different number of cameras moved to {backup.name}'
+        self.window.ui.statusbar.showMessage(message, 5000 if backup is None else 0)
+
+    def _on_session_failed(self, message: str):
+        self.window.show_progress('', 1, 1)
+        self.window.ui.statusbar.showMessage(f'Loading failed: {message}')
+
+    def _open_track(self, path: Path) -> tuple[TrackStore, Path | None]:
+        """Resume autosaved track of the session or start a new one.
+
+        A track of a different number of cameras is never overwritten, it's
+        moved aside to `.track.bak-<timestamp>`, which is returned as well.
+        """
+        backup = None
+        if path.exists():
+            track = TrackStore.open(path)
+            if track.n_cams == len(self.cam_keys):
+                return track, None
+            del track
+            backup = path.with_name(f'{path.name}.bak-{datetime.now():%Y%m%d-%H%M%S}')
+            path.rename(backup)
+        return TrackStore(len(self.cam_keys), path), backup
+
+    def save_track(self):
+        if self.track is not None:
+            self.track.flush()
+
+    def _schedule_autosave(self):
+        if not self._autosave_timer.isActive():
+            self._autosave_timer.start(self.autosave_interval)
+
+    def set_undistort_frames(self, enabled: bool):
+        self.undistort_frames = enabled
+
+    def set_estimate_uncertainty(self, enabled: bool):
+        self.estimate_uncertainty = enabled
+        # Estimate for already triangulated points as well
+        if enabled and self.track is not None:
+            self.retriangulate_all()
+
+    def _undistorted_pixel(self, cam_id: int, pos: QPointF) -> tuple[float, float]:
+        """Clicked position in undistorted image pixels"""
+        pix = pos.toTuple()
+        if self.undistort_frames:
+            # Frame is already undistorted
+            return pix
+        return tuple(self.session.undistorters[cam_id].undistort_points([pix])[0].tolist())
+
+    def _on_all_frames_clicked(self, frame_datetime: datetime, pixels: list[QPointF]):
+        self.triangulate_frame(frame_datetime, *pixels)
+        if self.window.ui.action_track_points.isChecked():
+            self.track_point(frame_datetime, pixels)
+
+    def _on_point_clicked(self, frame_datetime: datetime, cam_id: int, pos: QPointF):
+        if self.window.ui.action_match_points.isChecked():
+            self.propose_match(frame_datetime, cam_id, pos)
+
+    def propose_match(self, frame_datetime: datetime, cam_id: int, pos: QPointF):
+        """Search the point clicked in camera `cam_id` in background, the match is proposed in the window.
+
+        It's searched in the first other camera without a click at the frame.
+        """
+        clicked = self.window.clicked_points[frame_datetime]
+        other_id = next((i for i in range(len(self.cams)) if i != cam_id and clicked[i] is None), None)
+        if other_id is None:
+            return
+        # Frames are searched undistorted, in the pixels of the cameras
+        views = [
+            (video, frame, undistorter.undistort, camera, origin)
+            for video, frame, undistorter, camera, origin
+            in zip(self.session.videos, self.window.frame_numbers(frame_datetime), self.session.undistorters, self.cams, self.triangulator.cams_world)
+        ]
+        self._matching_worker.start(frame_datetime, other_id, views[cam_id], views[other_id], self._undistorted_pixel(cam_id, pos))
+
+    def _on_match_found(self, frame_datetime: datetime, cam_id: int, match: Match):
+        pixel = match.pixel
+        if not self.undistort_frames:
+            # Raw frame is displayed
+            pixel = tuple(self.session.undistorters[cam_id].distort_points([pixel])[0].tolist())
+        self.window.propose_point(frame_datetime, cam_id, QPointF(*pixel), match.confidence)
+
+    def track_point(self, frame_datetime: datetime, pixels: list[QPointF]):
+        """Track clicked point through the videos in background and triangulate every tracked frame"""
+        # Frames are tracked in the same pixel space as they are displayed and clicked
+        videos = [
+            (video, cam.frame_index, undistorter.undistort if self.undistort_frames else None)
+            for video, cam, undistorter in zip(self.session.videos, self.window.cams, self.session.undistorters)
+        ]
+        # Slider positions with the frames paired at them
+        forward, backward = (
+            [(dt, self.window.frame_numbers(dt)) for dt in self.window.slider_datetimes(frame_datetime, direction, self.tracking_max_steps)]
+            for direction in (True, False)
+        )
+        self._tracking_worker.start(videos, forward, backward, pixels)
+        self.window.ui.statusbar.showMessage('Tracking...')
+
+    def _on_point_tracked(self, frame_datetime: datetime, pixels: list[QPointF]):
+        # Manually clicked points are never replaced by tracked ones
+        if not self.track.is_manual(frame_datetime):
+            self.triangulate_frame(frame_datetime, *pixels, manual=False)
+
+    def triangulate_frame(self, frame_datetime: datetime, *pixels: QPointF | None, manual=True):
+        """Triangulate a point clicked in (at least two of) the cameras, `None` for missing clicks.
+
+        Tracked points aren't `manual`, they don't replace manual ones when tracked again.
+        """
+        pixels = [(np.nan, np.nan) if pos is None else self._undistorted_pixel(i, pos) for i, pos in enumerate(pixels)]
+        enu = self.triangulator.triangulate(*pixels)
+        geodetic = self.session.local_frame.enu2geodetic(enu)
+        uncertainty = self.uncertainty.estimate(*([pix] for pix in pixels))[0] if self.estimate_uncertainty else None
+        self.track.set(frame_datetime, [c for pix in pixels for c in pix], enu, geodetic, uncertainty, manual)
+        self._schedule_autosave()
+        print(frame_datetime, *pixels, enu.tolist(), geodetic.tolist())
+
+    def retriangulate_all(self):
+        """Recompute all stored points with current camera orientations in one pass"""
+        if not len(self.track):
+            return
+        pixels = self.track.column('pixels').reshape(len(self.track), -1, 2).transpose(1, 0, 2)
+        enu, _ = self.triangulator.triangulate_batch(*pixels)
+        geodetic = self.session.local_frame.enu2geodetic(enu)
+        uncertainty = self.uncertainty.estimate(*pixels) if self.estimate_uncertainty else None
+        self.track.set_results(enu, geodetic, uncertainty)
+        self._schedule_autosave()
 
     def export_data_gui(self):
         file_path_no_ext = f'{self.file_info.dir().path()}/{self.file_info.baseName()}'
@@ -96,14 +232,23 @@ class Controller:
             self.export_data(file_path)
 
     def export_data(self, file_path: str):
-        headers = 'datetime', 'e', 'n', 'u', 'lat', 'lon', 'alt'
-        rows = [(key, *val) for key, val in sorted(self.triangulated_frames.items())]
-
-        with open(file_path, 'w', newline='') as f:
-            w = csv.writer(f, delimiter='\t')
-            w.writerow(headers)
-            w.writerows(rows)
+        # Uncertainty columns are added once any point has them
+        if self.track.has_uncertainty():
+            write_data(file_path, self.track.rows(uncertainty=True), HEADERS + UNCERTAINTY_HEADERS)
+        else:
+            write_data(file_path, self.track.rows())
 
     def update_anchor_point(self, cam_id: int, point_id: int, pos: QPointF):
         print(locals())
-        self.cams[cam_id].update_anchor_point(point_id, pos.toTuple())
+        cam = self.cams[cam_id]
+        if point_id >= len(cam.anchors_world):
+            self.window.ui.statusbar.showMessage(f'No control point {point_id + 1} in the session')
+            return
+        cam.update_anchor_point(point_id, self._undistorted_pixel(cam_id, pos))
+        residuals = ' '.join(f'{r:.1f}' for r in cam.anchor_residuals())
+        self.window.ui.statusbar.showMessage(f'{self.cam_keys[cam_id]} control point residuals: {residuals} px')
+        if self.retriangulation_delay > 0:
+            # Restarting the timer postpones re-triangulation while anchors keep changing
+            self._retriangulation_timer.start(self.retriangulation_delay)
+        else:
+            self.retriangulate_all()
@@ -0,0 +1,173 @@
+from dataclasses import dataclass
+
+import numpy as np
+
+from lazy_import import lazy_import
+from triangulation import Camera
+
+cv = lazy_import('cv2')
+
+
+@dataclass
+class Match:
+    """Pixel proposed in the other camera"""
+    pixel: tuple[float, float]
+    score: float  # normalized cross-correlation of the match, -1..1
+    second_score: float  # best correlation farther than half a patch from the match along the line
+
+    @property
+    def confidence(self) -> float:
+        """0..1, high only for a strong correlation peak that stands out on the line"""
+        return max(0.0, self.score - max(0.0, self.second_score))
+
+
+class EpipolarMatcher:
+    """Finds the pixel of camera B showing the object seen at a pixel of camera A.
+
+    The object lies on the ray of the pixel, so camera B sees it on the
+    projection of the ray, the epipolar line. A patch around the pixel is
+    correlated with a narrow band along the line by a single
+    `cv.matchTemplate` (normalized cross-correlation); `band` pixels to each
+    side of the line absorb small orientation errors.
+
+    The patch and the band are both sampled along the epipolar lines of their
+    images, so a roll between the cameras doesn't break correlation. The lines
+    may run in opposite directions, so the patch is also tried rotated by 180
+    degrees. Images are grayscale or RGB arrays in undistorted pixels of the
+    cameras. Matches with `confidence` below `min_confidence` are rejected,
+    with a wide baseline a repeated texture along the line easily wins by
+    a small margin. `failure_reason` tells why `match` returned None.
+    """
+    def __init__(self, patch_size=21, band=3, min_depth=1.0, max_depth=1e4, min_contrast=2.0, min_confidence=0.15):
+        self.patch_size = patch_size
+        self.band = band
+        # Searched distances along the ray of camera A, m
+        self.min_depth = min_depth
+        self.max_depth = max_depth
+        # Patches with lower standard deviation of gray levels are featureless
+        self.min_contrast = min_contrast
+        self.min_confidence = min_confidence
+        self.failure_reason: str | None = None
+
+    def epipolar_segment(self, cam_a: Camera, origin_a, pixel_a, cam_b: Camera, origin_b,
+                         image_size: tuple[int, int]) -> np.ndarray | None:
+        """Endpoints (2, 2) of the epipolar line of `pixel_a` in camera B within `image_size` (width, height), near end first.
+
+        Only the part of the ray in front of camera B within the depth range is
+        projected; the line is kept far enough from the image border to fit
+        the search band. None if nothing is left.
+        """
+        direction = cam_a.pixel2dirvec_world(pixel_a)
+        direction = direction / np.linalg.norm(direction)
+        offset = np.asarray(origin_a, dtype=float) - np.asarray(origin_b, dtype=float)
+        # Depth in camera B is linear in the distance along the ray
+        (z0, z1) = cam_b.world2pixels([offset, direction])[1]
+        near, far = self.min_depth, self.max_depth
+        min_z = 1e-6
+        if z1 > 0:
+            near = max(near, (min_z - z0) / z1)
+        elif z1 < 0:
+            far = min(far, (min_z - z0) / z1)
+        elif z0 < min_z:
+            return None
+        if near >= far:
+            return None
+
+        ends, _ = cam_b.world2pixels(offset + np.array([[near], [far]]) * direction)
+        margin = self.patch_size // 2 + self.band
+        return _clip_segment(ends[0], ends[1], (margin, margin), (image_size[0] - 1 - margin, image_size[1] - 1 - margin))
+
+    def match(self, image_a: np.ndarray, image_b: np.ndarray, cam_a: Camera, origin_a, pixel_a,
+              cam_b: Camera, origin_b) -> Match | None:
+        """Best match of `pixel_a` of `image_a` on its epipolar line in `image_b`"""
+        self.failure_reason = None
+        gray_a, gray_b = _gray(image_a), _gray(image_b)
+        segment = self.epipolar_segment(cam_a, origin_a, pixel_a, cam_b, origin_b, (gray_b.shape[1], gray_b.shape[0]))
+        if segment is None:
+            self.failure_reason = 'epipolar line is outside the image'
+            return None
+
+        half = self.patch_size // 2
+        patch = np.arange(-half, half + 1)
+        template = _sample(gray_a, pixel_a, self._line_direction(cam_a, origin_a, pixel_a, origin_b), patch, patch)
+        if template.std() < self.min_contrast:
+            self.failure_reason = 'featureless patch'
+            return None
+
+        start, end = segment
+        length = float(np.linalg.norm(end - start))
+        along = (end - start) / length if length > 0 else np.array([1.0, 0.0])
+        n = int(length) + 1
+        strip = _sample(gray_b, start, along, np.arange(-half, n + half), np.arange(-half - self.band, half + self.band + 1))
+        # Rows are offsets across the line, columns are positions along it
+        scores = np.maximum(
+            cv.matchTemplate(strip, template, cv.TM_CCOEFF_NORMED),
+            cv.matchTemplate(strip, np.ascontiguousarray(template[::-1, ::-1]), cv.TM_CCOEFF_NORMED),
+        )
+        # Featureless parts of the strip give NaN
+        scores = np.nan_to_num(scores, nan=-1.0)
+        line_scores = scores.max(axis=0)
+        j = int(line_scores.argmax())
+        i = int(scores[:, j].argmax())
+
+        # Sub-pixel position along the line from a parabola through the peak
+        s = float(j)
+        if 0 < j < n - 1:
+            left, peak, right = line_scores[j - 1:j + 2]
+            curvature = left - 2 * peak + right
+            if curvature < 0:
+                s += 0.5 * (left - right) / curvature
+
+        others = np.abs(np.arange(n) - j) > half
+        second = float(line_scores[others].max()) if others.any() else -1.0
+        across = np.array([-along[1], along[0]])
+        pixel = start + s * along + (i - self.band) * across
+        match = Match(tuple(pixel.tolist()), float(line_scores[j]), second)
+        if match.confidence < self.min_confidence:
+            self.failure_reason = f'ambiguous match (confidence {match.confidence:.2f})'
+            return None
+        return match
+
+    @staticmethod
+    def _line_direction(cam_a: Camera, origin_a, pixel_a, origin_b) -> np.ndarray:
+        """Unit direction of the epipolar line through `pixel_a` in camera A"""
+        baseline = np.asarray(origin_b, dtype=float) - np.asarray(origin_a, dtype=float)
+        normal = np.cross(baseline, cam_a.pixel2dirvec_world(pixel_a))
+        # Pixels x of the epipolar plane satisfy (K^-T R^T n) . [x, 1] = 0
+        line = cam_a.mtx_inv.T @ cam_a.rotation_mtx_cam2world.T @ normal
+        direction = np.array([line[1], -line[0]])
+        norm = np.linalg.norm(direction)
+        # Ray along the baseline, any direction will do
+        return direction / norm if norm > 0 else np.array([1.0, 0.0])
+
+
+def _gray(image: np.ndarray) -> np.ndarray:
+    if image.ndim == 3:
+        image = cv.cvtColor(image, cv.COLOR_RGB2GRAY if image.shape[2] == 3 else cv.COLOR_RGBA2GRAY)
+    return image.astype(np.float32)
+
+
+def _sample(image: np.ndarray, origin, along, s: np.ndarray, t: np.ndarray) -> np.ndarray:
+    """Image at `origin + s * along + t * across`, rows are `t` and columns are `s`"""
+    across = -along[1], along[0]
+    map_x = (origin[0] + s[None] * along[0] + t[:, None] * across[0]).astype(np.float32)
+    map_y = (origin[1] + s[None] * along[1] + t[:, None] * across[1]).astype(np.float32)
+    return cv.remap(image, map_x, map_y, cv.INTER_LINEAR, borderMode=cv.BORDER_REPLICATE)
+
+
+def _clip_segment(p0: np.ndarray, p1: np.ndarray, lo, hi) -> np.ndarray | None:
+    """Part (2, 2) of segment p0-p1 inside the box [lo, hi] (Liang-Barsky), None if outside"""
+    d = p1 - p0
+    t0, t1 = 0.0, 1.0
+    for k in range(2):
+        for p, q in (-d[k], p0[k] - lo[k]), (d[k], hi[k] - p0[k]):
+            if p == 0:
+                if q < 0:
+                    return None
+            elif p < 0:
+                t0 = max(t0, q / p)
+            else:
+                t1 = min(t1, q / p)
+    if t0 > t1:
+        return None
+    return np.array([p0 + t0 * d, p0 + t1 * d])
@@ -0,0 +1,116 @@
+import os
+from pathlib import Path
+
+import numpy as np
+
+from lazy_import import lazy_import
+
+cv = lazy_import('cv2')
+
+
+class FrameIndex:
+    """Presentation timestamps and keyframe flags of every frame of a video.
+
+    The video is scanned once by reading packets without decoding them. The
+    index is cached in a `.frames.npz` sidecar file next to the video and is
+    rebuilt when the size or modification time of the video changes.
+    """
+    SUFFIX = '.frames.npz'
+
+    def __init__(self, timestamps: np.ndarray, keyframes: np.ndarray) -> None:
+        order = np.argsort(timestamps, kind='stable')
+        self.timestamps = np.asarray(timestamps, dtype=np.float64)[order]  # in milliseconds
+        self.keyframes = np.asarray(keyframes, dtype=bool)[order]
+
+    @classmethod
+    def scan(cls, video_path: str) -> 'FrameIndex':
+        capture = cv.VideoCapture(video_path)
+        # Raw mode: grab() demuxes packets without decoding them
+        capture.set(cv.CAP_PROP_FORMAT, -1)
+        timestamps = []
+        keyframes = []
+        while capture.grab():
+            timestamps.append(capture.get(cv.CAP_PROP_POS_MSEC))
+            keyframes.append(capture.get(cv.CAP_PROP_LRF_HAS_KEY_FRAME))
+        capture.release()
+        return cls(np.array(timestamps), np.array(keyframes))
+
+    @classmethod
+    def load(cls, video_path: str) -> 'FrameIndex':
+        """Load cached index of the video or scan and cache it"""
+        sidecar = Path(f'{video_path}{cls.SUFFIX}')
+        stat = os.stat(video_path)
+        key = np.array([stat.st_size, stat.st_mtime_ns], dtype=np.int64)
+        if sidecar.exists():
+            with np.load(sidecar) as f:
+                if np.array_equal(f['key'], key):
+                    return cls(f['timestamps'], f['keyframes'])
+
+        index = cls.scan(video_path)
+        try:
+            with open(sidecar, 'wb') as f:
+                np.savez(f, key=key, timestamps=index.timestamps, keyframes=index.keyframes)
+        except OSError:
+            pass  # Read-only location, index is just not cached
+        return index
+
+    def __len__(self) -> int:
+        return len(self.timestamps)
+
+    @property
+    def last(self) -> float:
+        """Timestamp of the last frame in milliseconds"""
+        return float(self.timestamps[-1])
+
+    def nearest(self, pos: float) -> int:
+        """Index of the frame with the timestamp nearest to `pos` milliseconds"""
+        i = int(np.searchsorted(self.timestamps, pos))
+        if i == len(self.timestamps) or (i > 0 and pos - self.timestamps[i - 1] <= self.timestamps[i] - pos):
+            i -= 1
+        return i
+
+    def snap(self, pos: float) -> float:
+        """Timestamp of the frame nearest to `pos` milliseconds"""
+        return float(self.timestamps[self.nearest(pos)])
+
+    def keyframe_before(self, pos: float) -> float:
+        """Timestamp of the last keyframe at or before `pos` milliseconds"""
+        keys = self.timestamps[self.keyframes & (self.timestamps <= pos)]
+        return float(keys[-1]) if len(keys) else float(self.timestamps[0])
+
+
+class FrameReader:
+    """Decodes frames of a video by their number in its `FrameIndex`.
+
+    A frame is decoded from the last keyframe at or before it and decoded
+    frames are identified by their timestamps, so the returned frame is the
+    indexed one however accurately the container seeks. Reading a later frame
+    of the same group of pictures continues decoding without seeking.
+    """
+    def __init__(self, video_path: str, index: FrameIndex | None = None) -> None:
+        self.capture = cv.VideoCapture(video_path)
+        self.index = index or FrameIndex.load(video_path)
+        self._current = -1  # Last decoded frame, -1 if unknown
+
+    def read(self, frame: int, image: np.ndarray | None = None) -> np.ndarray | None:
+        """BGR image of frame number `frame`, decoded into `image` if given, None if it can't be decoded"""
+        timestamps = self.index.timestamps
+        key = self.index.keyframe_before(timestamps[frame])
+        # Decoding on from the current frame is no slower than from the keyframe
+        if not (0 <= self._current < frame and key <= timestamps[self._current]):
+            self.capture.set(cv.CAP_PROP_POS_MSEC, key)
+        while self.capture.grab():
+            self._current = self.index.nearest(self.capture.get(cv.CAP_PROP_POS_MSEC))
+            if self._current >= frame:
+                break
+        else:
+            self._current = -1
+            return None
+        if self._current != frame:
+            # Seek landed after the frame
+            return None
+        ok, image = self.capture.retrieve(image)
+        return image if ok else None
+
+    def release(self):
+        self.capture.release()
@@ -0,0 +1,42 @@
+from collections.abc import Sequence
+
+import numpy as np
+
+from lazy_import import lazy_import
+
+pm = lazy_import('pymap3d')
+
+
+class LocalFrame:
+    """Local ENU frame with the origin at a geodetic point.
+
+    Ellipsoid, origin ECEF position and ENU->ECEF rotation are computed once,
+    so converting whole arrays of points is just a matrix product plus a
+    single vectorized pymap3d call.
+    """
+    def __init__(self, origin_geodetic: Sequence[float], ell: 'pm.Ellipsoid | None' = None) -> None:
+        self.ell = ell or pm.Ellipsoid.from_name('wgs84')
+        self.origin_geodetic = tuple(origin_geodetic)
+        lat0, lon0, alt0 = self.origin_geodetic
+        self.origin_ecef = np.array(pm.geodetic2ecef(lat0, lon0, alt0, self.ell))
+
+        # Columns are east, north and up unit vectors in ECEF
+        lat, lon = np.radians(lat0), np.radians(lon0)
+        self.rotation_enu2ecef = np.array([
+            [-np.sin(lon), -np.sin(lat) * np.cos(lon), np.cos(lat) * np.cos(lon)],
+            [ np.cos(lon), -np.sin(lat) * np.sin(lon), np.cos(lat) * np.sin(lon)],
+            [           0,                np.cos(lat),               np.sin(lat)],
+        ])
+
+    def enu2geodetic(self, enu) -> np.ndarray:
+        """(N, 3) or (3,) ENU points -> lat, lon, alt of the same shape"""
+        enu = np.asarray(enu, dtype=float)
+        ecef = enu @ self.rotation_enu2ecef.T + self.origin_ecef
+        lat, lon, alt = pm.ecef2geodetic(*np.moveaxis(ecef, -1, 0), self.ell)
+        return np.stack([lat, lon, alt], axis=-1)
+
+    def geodetic2enu(self, geodetic) -> np.ndarray:
+        """(N, 3) or (3,) lat, lon, alt -> ENU points of the same shape"""
+        geodetic = np.asarray(geodetic, dtype=float)
+        ecef = np.stack(pm.geodetic2ecef(*np.moveaxis(geodetic, -1, 0), self.ell), axis=-1)
+        return (ecef - self.origin_ecef) @ self.rotation_enu2ecef
@@ -1,22 +1,67 @@
+import time
+
+# Before the other imports, so that the startup report includes them
+STARTED = time.perf_counter_ns()
+
+import argparse
 import sys
 
-from PySide6.QtCore import Qt
+from PySide6.QtCore import Qt, QTimer
 from PySide6.QtWidgets import QApplication
 
 from controller import Controller
+from startup_timing import StartupTimer
 from ui.main_window import MainWindow
 
+
+def report_startup(timer: StartupTimer, window: MainWindow, controller: Controller, file_path: str):
+    """Print startup milestones once every camera shows its first frame and append them to `file_path` if given"""
+    shown = set()
+
+    def on_session_loaded(loaded):
+        if 'session' in timer.marks:
+            return
+        timer.steps.update(loaded.timings)
+        timer.mark('session')
+        # Views are created by the controller when the first session is loaded
+        for cam in window.cams:
+            cam.frame_displayed.connect(lambda cam=cam: on_frame_displayed(cam))
+
+    def on_frame_displayed(cam):
+        shown.add(cam)
+        if len(shown) < len(window.cams) or 'first frame' in timer.marks:
+            return
+        timer.mark('first frame')
+        print(f'Startup: {timer.report()}')
+        if file_path:
+            timer.save(file_path)
+
+    # After the controller's connection, so that the views exist
+    controller.session_loader.loaded.connect(on_session_loaded)
+
+
 if __name__ == '__main__':
-    app = QApplication([])
+    parser = argparse.ArgumentParser(description='Triangulate points clicked in synchronized videos')
+    parser.add_argument('session', nargs='?', default='video/test copy.json', help='session JSON file')
+    parser.add_argument('--cams', nargs='+', help='camera keys in the session file, else its `cams` list')
+    parser.add_argument('--startup-report', nargs='?', const='', metavar='FILE',
+                        help='print startup milestones and append them to FILE as a JSON line')
+    args = parser.parse_args()
+    timer = StartupTimer(STARTED)
+    timer.mark('imports')
+
+    app = QApplication(sys.argv[:1])
 
-    cam_names = 'cam1', 'cam2'
     window = MainWindow()
     window.closed.connect(app.quit, Qt.ConnectionType.QueuedConnection)
 
-    controller = Controller(window, cam_names)
-
-
-    controller.load_file('video/test copy.json')
+    controller = Controller(window, args.cams)
+    if args.startup_report is not None:
+        report_startup(timer, window, controller, args.startup_report)
 
+    # Window is shown right away, the session is loaded in background
     window.show()
+    timer.mark('window')
+    QTimer.singleShot(0, lambda: controller.load_file(args.session))
+
     sys.exit(app.exec())
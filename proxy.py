@@ -0,0 +1,214 @@
+"""Undistorted proxy videos rendered ahead of time
+
+Proxies are intra-frame MJPG videos with the same frames as the source, so
+seeking is cheap and frames are displayed without any processing. They are
+cached in a `.proxies` directory next to the session file, keyed by a hash of
+the video file and its calibration.
+
+    python proxy.py session.json --scale 0.5 --jobs 8
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+
+from frame_index import FrameIndex, FrameReader
+from lazy_import import lazy_import
+from session import Session
+from undistortion import ImageUndistorter
+
+cv = lazy_import('cv2')
+
+PROXY_DIR = '.proxies'
+
+
+@dataclass
+class Proxy:
+    file_path: str
+    fps: float
+    frames: int
+    scale: float
+
+    def position(self, frame: int) -> float:
+        """Position of frame number `frame` in milliseconds"""
+        return frame * 1000 / self.fps
+
+    def frame_index(self) -> FrameIndex:
+        """Index of the proxy, every frame is a keyframe"""
+        return FrameIndex(self.position(np.arange(self.frames)), np.ones(self.frames, dtype=bool))
+
+
+def proxy_key(video_path: str, undistorter: ImageUndistorter) -> str:
+    """Hash of the video file and its calibration with the undistortion options.
+
+    The file is identified by its size and the first and last megabyte, which
+    is enough to tell recordings apart without reading gigabytes.
+    """
+    h = hashlib.sha256()
+    size = os.path.getsize(video_path)
+    h.update(str(size).encode())
+    with open(video_path, 'rb') as f:
+        h.update(f.read(2**20))
+        f.seek(max(size - 2**20, 0))
+        h.update(f.read(2**20))
+    h.update(np.asarray(undistorter.mtx, dtype=np.float64)[[0, 1, 0, 1], [0, 1, 2, 2]].tobytes())  # fx, fy, cx, cy
+    h.update(np.asarray(undistorter.distortion_coeffs, dtype=np.float64).tobytes())
+    if undistorter.alpha is not None:
+        # Change the undistorted image, keys of proxies without them stay the same
+        h.update(repr((float(undistorter.alpha), bool(undistorter.crop_to_roi))).encode())
+    if undistorter.interpolation != cv.INTER_LINEAR:
+        h.update(f'interpolation {undistorter.interpolation}'.encode())
+    return h.hexdigest()[:32]
+
+
+def _load_proxy(meta_path: Path) -> Proxy:
+    with open(meta_path) as f:
+        meta = json.load(f)
+    # Proxies are stored by file name, so the cache can be moved with the session
+    return Proxy(str(meta_path.with_name(meta.pop('file'))), **meta)
+
+
+def _save_proxy(meta_path: Path, proxy: Proxy):
+    meta = dict(proxy.__dict__)
+    meta['file'] = Path(meta.pop('file_path')).name
+    with open(meta_path, 'w') as f:
+        json.dump(meta, f)
+
+
+def find_proxy(cache_dir: Path, video_path: str, undistorter: ImageUndistorter) -> Proxy | None:
+    """Cached proxy of the video with the largest scale, if any"""
+    if not cache_dir.exists():
+        return None
+    key = proxy_key(video_path, undistorter)
+    proxies = [_load_proxy(meta_path) for meta_path in cache_dir.glob(f'{key}_*.json')]
+    return max(proxies, key=lambda p: p.scale, default=None)
+
+
+def _render_chunk(video_path: str, timestamps, keyframes, mtx, distortion_coeffs, interpolation: int, alpha: float | None,
+                  crop_to_roi: bool, scale: float, fps: float, start: int, count: int, out_path: str) -> int:
+    """Undistort and downscale `count` frames starting from frame `start` into `out_path`.
+
+    Frames are decoded from the last keyframe before `start`, see `FrameReader`.
+    Returns the number of frames written, fewer than `count` if a frame can't be decoded.
+    """
+    undistorter = ImageUndistorter(np.asarray(mtx), np.asarray(distortion_coeffs), interpolation, alpha, crop_to_roi)
+    reader = FrameReader(video_path, FrameIndex(timestamps, keyframes))
+    writer = None
+    written = 0
+    for i in range(start, start + count):
+        frame = reader.read(i)
+        if frame is None:
+            break
+        frame = undistorter.undistort(frame)
+        if scale != 1:
+            frame = cv.resize(frame, None, fx=scale, fy=scale, interpolation=cv.INTER_AREA)
+        if writer is None:
+            writer = cv.VideoWriter(out_path, cv.VideoWriter_fourcc(*'MJPG'), fps, (frame.shape[1], frame.shape[0]))
+            writer.set(cv.VIDEOWRITER_PROP_QUALITY, 90)
+        writer.write(frame)
+        written += 1
+    reader.release()
+    if writer is not None:
+        writer.release()
+    return written
+
+
+def _concatenate(chunks: list[str], out_path: str, fps: float):
+    if shutil.which('ffmpeg'):
+        # Stream copy, no re-encoding
+        list_path = f'{out_path}.txt'
+        with open(list_path, 'w') as f:
+            f.writelines(f"file '{Path(chunk).resolve().as_posix()}'\n" for chunk in chunks)
+        subprocess.run(['ffmpeg', '-y', '-loglevel', 'error', '-f', 'concat', '-safe', '0', '-i', list_path, '-c', 'copy', out_path], check=True)
+        os.remove(list_path)
+        return
+
+    writer = None
+    for chunk in chunks:
+        capture = cv.VideoCapture(chunk)
+        while True:
+            ok, frame = capture.read()
+            if not ok:
+                break
+            if writer is None:
+                writer = cv.VideoWriter(out_path, cv.VideoWriter_fourcc(*'MJPG'), fps, (frame.shape[1], frame.shape[0]))
+                writer.set(cv.VIDEOWRITER_PROP_QUALITY, 90)
+            writer.write(frame)
+        capture.release()
+    if writer is not None:
+        writer.release()
+
+
+def render_proxy(video_path: str, undistorter: ImageUndistorter, cache_dir: Path, scale=1.0,
+                 pool: ProcessPoolExecutor | None = None, chunk_frames=500) -> Proxy:
+    """Render undistorted proxy of the video in frame-range chunks across `pool`.
+
+    Raises RuntimeError and leaves no proxy if any frame can't be decoded.
+    """
+    key = proxy_key(video_path, undistorter)
+    out_path = cache_dir / f'{key}_{scale:g}.avi'
+    meta_path = out_path.with_suffix('.json')
+    if meta_path.exists():
+        return _load_proxy(meta_path)
+
+    index = FrameIndex.load(video_path)
+    frames = len(index)
+    # Constant frame rate with the same number of frames, frame i of the proxy is frame i of the source
+    fps = (frames - 1) * 1000 / index.last if frames > 1 else 25.0
+
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    with tempfile.TemporaryDirectory(dir=cache_dir) as tmp:
+        chunks = []
+        results = []
+        for i, start in enumerate(range(0, frames, chunk_frames)):
+            chunk = str(Path(tmp) / f'{i:05}.avi')
+            chunks.append(chunk)
+            count = min(chunk_frames, frames - start)
+            args = (video_path, index.timestamps, index.keyframes, undistorter.mtx.tolist(), undistorter.distortion_coeffs.tolist(),
+                    undistorter.interpolation, undistorter.alpha, undistorter.crop_to_roi, scale, fps, start, count, chunk)
+            results.append((start, count, pool.submit(_render_chunk, *args) if pool else _render_chunk(*args)))
+        # Every chunk is finished before the temporary directory is removed
+        counts = [result.result() if pool else result for _, _, result in results]
+        for (start, count, _), written in zip(results, counts):
+            if written != count:
+                # Frame i of the proxy would no longer be frame i of the source
+                raise RuntimeError(f'{Path(video_path).name}: frame {start + written} can\'t be decoded')
+        _concatenate(chunks, str(out_path), fps)
+
+    proxy = Proxy(str(out_path), fps, frames, scale)
+    # Metadata is written last and marks the proxy as complete
+    _save_proxy(meta_path, proxy)
+    return proxy
+
+
+def proxy_dir(session: Session) -> Path:
+    return session.file_path.parent / PROXY_DIR
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('session', help='session JSON file')
+    parser.add_argument('--scale', type=float, default=1.0, help='downscale factor of proxies, e.g. 0.5')
+    parser.add_argument('--cams', nargs='+', help='camera keys in the session file')
+    parser.add_argument('--chunk-frames', type=int, default=500, help='frames rendered by one task')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(), help='number of worker processes')
+    args = parser.parse_args()
+
+    session = Session(args.session, args.cams)
+    with ProcessPoolExecutor(args.jobs) as pool:
+        for cam, video, undistorter in zip(session.cam_keys, session.videos, session.undistorters):
+            proxy = render_proxy(video, undistorter, proxy_dir(session), args.scale, pool, args.chunk_frames)
+            print(f'{cam}: {proxy.frames} frames -> {proxy.file_path}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,165 @@
+"""Per-pixel ray lookup tables of distorted video frames
+
+A table holds the unit ray of every pixel of the raw (distorted) frame in
+camera coordinates, with lens distortion folded in, so that rays of raw pixels
+are a bilinear gather instead of a converged iterative undistortion. It pays
+off for batches of raw pixels (batch.py --distorted): a gather is slower than
+the default 5 iterations of `cv.undistortPoints`, which single clicks use.
+Tables depend only on the calibration and the frame size, an anchor change
+only rotates the camera, so looked up rays are rotated and the table is never
+rebuilt. Rays don't depend on the output matrix of undistortion either (`alpha`,
+`crop_to_roi`), it only projects them to undistorted pixels. They are float32
+`.npy` files cached in a `.rays` directory next to the session file and
+memory-mapped when loaded.
+
+    python ray_lut.py session.json
+"""
+
+import argparse
+import hashlib
+import os
+from pathlib import Path
+
+import numpy as np
+
+from lazy_import import lazy_import
+from session import Session, video_size
+from undistortion import ImageUndistorter
+
+cv = lazy_import('cv2')
+
+RAY_TABLE_DIR = '.rays'
+
+
+class RayTable:
+    """Unit rays (H, W, 3) in camera coordinates of the pixels of a distorted frame"""
+    def __init__(self, rays: np.ndarray) -> None:
+        self.rays = rays
+
+    @property
+    def size(self) -> tuple[int, int]:
+        """(width, height) of the frame"""
+        return self.rays.shape[1], self.rays.shape[0]
+
+    @classmethod
+    def build(cls, mtx, distortion_coeffs, size: tuple[int, int], out: np.ndarray | None = None, rows=64) -> 'RayTable':
+        """Table of frames of `size` (width, height), written into `out` (e.g. a memory-mapped file) if given"""
+        w, h = size
+        rays = np.empty((h, w, 3), np.float32) if out is None else out
+        # Converged inversion of the distortion model, the default 5 iterations are off by tenths of a pixel at the corners
+        criteria = cv.TERM_CRITERIA_COUNT | cv.TERM_CRITERIA_EPS, 20, 1e-12
+        u = np.arange(w, dtype=np.float64)
+        for y in range(0, h, rows):
+            v = np.arange(y, min(y + rows, h), dtype=np.float64)
+            pixels = np.stack(np.broadcast_arrays(u[None], v[:, None]), axis=-1).reshape(-1, 1, 2)
+            normalized = cv.undistortPointsIter(pixels, mtx, distortion_coeffs, None, None, criteria).reshape(len(v), w, 2)
+            block = np.concatenate([normalized, np.ones((len(v), w, 1))], axis=-1)
+            rays[y:y + len(v)] = block / np.linalg.norm(block, axis=-1, keepdims=True)
+        return cls(rays)
+
+    def lookup(self, pixels) -> np.ndarray:
+        """Unit rays (N, 3) in camera coordinates of (N, 2) distorted pixels, interpolated bilinearly.
+
+        NaN for NaN pixels and pixels outside the frame.
+        """
+        pixels = np.asarray(pixels, dtype=float).reshape(-1, 2)
+        w, h = self.size
+        x, y = pixels[:, 0], pixels[:, 1]
+        # Pixel centers are at integer coordinates, the outer half pixel is extrapolated
+        inside = (x >= -0.5) & (x <= w - 0.5) & (y >= -0.5) & (y <= h - 0.5)
+        x = np.where(inside, x, 0.0)
+        y = np.where(inside, y, 0.0)
+        x0 = np.clip(np.floor(x), 0, w - 2)
+        y0 = np.clip(np.floor(y), 0, h - 2)
+        # Weights and rays in float32 like the table, gathered from the flat table by linear indexes
+        fx = (x - x0).astype(np.float32)[:, None]
+        fy = (y - y0).astype(np.float32)[:, None]
+        i = y0.astype(np.intp) * w + x0.astype(np.intp)
+        flat = self.rays.reshape(-1, 3)
+        top_left, top_right = np.take(flat, i, axis=0), np.take(flat, i + 1, axis=0)
+        bottom_left, bottom_right = np.take(flat, i + w, axis=0), np.take(flat, i + w + 1, axis=0)
+        top = top_left + (top_right - top_left) * fx
+        bottom = bottom_left + (bottom_right - bottom_left) * fx
+        rays = (top + (bottom - top) * fy).astype(np.float64)
+        rays /= np.linalg.norm(rays, axis=-1, keepdims=True)
+        rays[~inside] = np.nan
+        return rays
+
+    def undistort_points(self, pixels, output_mtx) -> np.ndarray:
+        """Map (N, 2) distorted pixels to pixels of the undistorted frame with camera matrix `output_mtx`"""
+        projected = self.lookup(pixels) @ np.asarray(output_mtx, dtype=float).T
+        return projected[:, :2] / projected[:, 2:]
+
+
+def ray_table_key(undistorter: ImageUndistorter) -> str:
+    """Hash of the calibration"""
+    h = hashlib.sha256()
+    h.update(np.asarray(undistorter.mtx, dtype=np.float64)[[0, 1, 0, 1], [0, 1, 2, 2]].tobytes())  # fx, fy, cx, cy
+    h.update(np.asarray(undistorter.distortion_coeffs, dtype=np.float64).tobytes())
+    return h.hexdigest()[:32]
+
+
+def _ray_table_path(cache_dir: Path, undistorter: ImageUndistorter, size: tuple[int, int]) -> Path:
+    return cache_dir / f'{ray_table_key(undistorter)}_{size[0]}x{size[1]}.npy'
+
+
+def find_ray_table(cache_dir: Path, undistorter: ImageUndistorter, size: tuple[int, int]) -> RayTable | None:
+    """Cached table of the calibration and frame `size` (width, height), memory-mapped, if any"""
+    path = _ray_table_path(cache_dir, undistorter, size)
+    return RayTable(np.load(path, mmap_mode='r')) if path.exists() else None
+
+
+def load_ray_table(cache_dir: Path, undistorter: ImageUndistorter, size: tuple[int, int]) -> RayTable:
+    """Cached table of the calibration and frame `size` (width, height), built and cached if missing"""
+    table = find_ray_table(cache_dir, undistorter, size)
+    if table is not None:
+        return table
+
+    path = _ray_table_path(cache_dir, undistorter, size)
+
+    try:
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix('.tmp')
+        out = np.lib.format.open_memmap(tmp_path, 'w+', np.float32, (size[1], size[0], 3))
+    except OSError:
+        # Read-only location, table is just not cached
+        return RayTable.build(undistorter.mtx, undistorter.distortion_coeffs, size)
+    RayTable.build(undistorter.mtx, undistorter.distortion_coeffs, size, out)
+    out.flush()
+    del out
+    # Renamed when complete, so a partial table is never loaded
+    os.replace(tmp_path, path)
+    return RayTable(np.load(path, mmap_mode='r'))
+
+
+def load_ray_tables(session: Session, build=True) -> int:
+    """Attach tables to the cameras of the session, building missing ones if `build`.
+
+    Returns the number of cameras with a table.
+    """
+    cache_dir = ray_table_dir(session)
+    for cam, video, undistorter in zip(session.cams, session.videos, session.undistorters):
+        load = load_ray_table if build else find_ray_table
+        cam.ray_table = load(cache_dir, undistorter, video_size(video))
+    return sum(cam.ray_table is not None for cam in session.cams)
+
+
+def ray_table_dir(session: Session) -> Path:
+    return session.file_path.parent / RAY_TABLE_DIR
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('session', help='session JSON file')
+    parser.add_argument('--cams', nargs='+', help='camera keys in the session file')
+    args = parser.parse_args()
+
+    session = Session(args.session, args.cams)
+    load_ray_tables(session)
+    for key, cam in zip(session.cam_keys, session.cams):
+        w, h = cam.ray_table.size
+        print(f'{key}: {w}x{h} rays -> {ray_table_dir(session)}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+import csv
+import json
+from collections.abc import Iterable, Sequence
+from pathlib import Path
+
+import numpy as np
+
+from geodesy import LocalFrame
+from lazy_import import lazy_import
+from triangulation import Camera, MultiTriangulator
+from undistortion import ImageUndistorter
+
+cv = lazy_import('cv2')
+
+HEADERS = 'datetime', 'e', 'n', 'u', 'lat', 'lon', 'alt'
+DEFAULT_CAM_KEYS = 'cam1', 'cam2'
+
+
+class Session:
+    """Session file parsed into cameras, undistorters and a triangulator.
+
+    Does not depend on Qt, so it can be used both by the GUI and headless.
+    Camera keys are taken from `cam_keys`, else from the optional `cams` list
+    of the session file, else `cam1` and `cam2` are used.
+
+    Control points are the `cps_geodetic` list with a `cps_pix` list of every
+    camera (null for points the camera doesn't see), else `cp1_geodetic`,
+    `cp2_geodetic` with `cp1_pix`, `cp2_pix`.
+
+    Optional `alpha`, `crop_to_roi` and `interpolation` (`nearest`, `linear`,
+    `cubic`, ...) of a camera are passed to its `ImageUndistorter`. `alpha` and
+    `crop_to_roi` change the undistorted image, so the undistorter is prepared
+    for the frame size and cameras use its output matrix. The size is the
+    optional `width` and `height` of the camera, else it's read from the video.
+    """
+    def __init__(self, file_path: str, cam_keys: Sequence[str] | None = None) -> None:
+        self.file_path = Path(file_path)
+
+        with open(file_path) as f:
+            self.data: dict = json.load(f)
+        self.cam_keys = list(cam_keys or self.data.get('cams', DEFAULT_CAM_KEYS))
+        if len(self.cam_keys) < 2:
+            raise ValueError(f'{self.file_path.name}: {len(self.cam_keys)} camera(s) {self.cam_keys}, at least 2 are needed')
+        cps_geodetic = np.array(self.data.get('cps_geodetic') or [self.data['cp1_geodetic'], self.data['cp2_geodetic']])
+
+        self.cams: list[Camera] = []
+        self.videos: list[str] = []
+        self.undistorters: list[ImageUndistorter] = []
+        for cam in self.cam_keys:
+            if cam not in self.data:
+                raise ValueError(f'No camera {cam!r} in {self.file_path.name}')
+            video = self.data[cam]['file']
+            self.videos.append(str(self.file_path.parent / video))
+
+            # Form matrix of intrinsic parameters
+            fx = self.data[cam]['fx']
+            fy = self.data[cam]['fy']
+            cx = self.data[cam]['cx']
+            cy = self.data[cam]['cy']
+            cam_mtx = np.array([
+                [fx,  0, cx],
+                [ 0, fy, cy],
+                [ 0,  0,  1],
+            ])
+
+            distortion_coeffs = np.array(self.data[cam]['distortion_coeffs'])
+            undistorter = ImageUndistorter(cam_mtx, distortion_coeffs, _interpolation(cam, self.data[cam].get('interpolation')),
+                                           alpha=self.data[cam].get('alpha'), crop_to_roi=self.data[cam].get('crop_to_roi', False))
+            if undistorter.alpha is not None:
+                # Output camera matrix depends on the frame size
+                undistorter.prepare(self._frame_size(cam, self.videos[-1]))
+            self.undistorters.append(undistorter)
+
+            cam_geodetic = self.data[cam]['cam_geodetic']
+            # TODO: add zero initialization if keys don't exist and maybe notify user!
+            cps_pix = self.data[cam].get('cps_pix') or [self.data[cam]['cp1_pix'], self.data[cam]['cp2_pix']]
+            if len(cps_pix) != len(cps_geodetic):
+                raise ValueError(f'{cam}: {len(cps_pix)} control point pixels for {len(cps_geodetic)} control points')
+            cps_world = LocalFrame(cam_geodetic).geodetic2enu(cps_geodetic)
+
+            camera = Camera(undistorter.output_mtx, list(cps_world), cps_pix)
+            self.cams.append(camera)
+
+        # ENU frame is centered at the first camera
+        self.origin_geodetic = self.data[self.cam_keys[0]]['cam_geodetic']
+        self.local_frame = LocalFrame(self.origin_geodetic)
+        cams_world = self.local_frame.geodetic2enu([self.data[cam]['cam_geodetic'] for cam in self.cam_keys])
+        self.triangulator = MultiTriangulator(self.cams, cams_world)
+
+    def _frame_size(self, cam: str, video: str) -> tuple[int, int]:
+        """(width, height) of frames of camera `cam`, from the session file if given, else from its `video`"""
+        if 'width' in self.data[cam] and 'height' in self.data[cam]:
+            return int(self.data[cam]['width']), int(self.data[cam]['height'])
+        size = video_size(video)
+        if 0 in size:
+            # E.g. batch runs with pixel files only
+            raise ValueError(f'{cam}: can\'t read frame size of {video}, set `width` and `height` of the camera')
+        return size
+
+
+def _interpolation(cam: str, name: str | None) -> int | None:
+    """OpenCV interpolation flag of `name`, e.g. `nearest` for `cv.INTER_NEAREST`"""
+    if name is None:
+        return None
+    flag = getattr(cv, f'INTER_{name.upper()}', None)
+    if flag is None:
+        raise ValueError(f'{cam}: unknown interpolation {name!r}')
+    return flag
+
+
+def video_size(video_path: str) -> tuple[int, int]:
+    """(width, height) of frames of the video"""
+    capture = cv.VideoCapture(video_path)
+    size = round(capture.get(cv.CAP_PROP_FRAME_WIDTH)), round(capture.get(cv.CAP_PROP_FRAME_HEIGHT))
+    capture.release()
+    return size
+
+
+def write_data(file_path: str, rows: Iterable[Sequence], headers: Sequence[str] = HEADERS):
+    """Write triangulated rows (datetime, e, n, u, lat, lon, alt, ...) as tab-separated text"""
+    with open(file_path, 'w', newline='') as f:
+        w = csv.writer(f, delimiter='\t')
+        w.writerow(headers)
+        w.writerows(rows)
@@ -0,0 +1,34 @@
+import json
+import time
+from datetime import datetime
+
+
+class StartupTimer:
+    """Milestones of application startup in milliseconds since `start` (perf_counter_ns).
+
+    Only the first occurrence of every milestone is kept, so marks can be
+    connected to signals that fire repeatedly.
+    """
+    def __init__(self, start: int | None = None):
+        self.start = time.perf_counter_ns() if start is None else start
+        self.marks: dict[str, float] = {}
+        # Durations of steps that are not measured from the start, e.g. of background loading
+        self.steps: dict[str, float] = {}
+
+    def mark(self, name: str):
+        if name not in self.marks:
+            self.marks[name] = (time.perf_counter_ns() - self.start) / 1e6
+
+    def report(self) -> str:
+        """E.g. `imports 310 | window 420 | session 650 | first frame 900 ms`"""
+        parts = [f'{name} {ms:.0f}' for name, ms in self.marks.items()]
+        report = ' | '.join(parts) + ' ms' if parts else ''
+        if self.steps:
+            report += ' (' + ', '.join(f'{name} {ms:.0f}' for name, ms in self.steps.items()) + ' ms)'
+        return report
+
+    def save(self, file_path: str):
+        """Append the report as a JSON line, so that startups can be compared over time"""
+        record = {'time': datetime.now().isoformat(timespec='seconds'), 'marks': self.marks, 'steps': self.steps}
+        with open(file_path, 'a') as f:
+            f.write(json.dumps(record) + '\n')
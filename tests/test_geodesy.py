@@ -0,0 +1,43 @@
+import numpy as np
+import pymap3d as pm
+import pytest
+
+from geodesy import LocalFrame
+
+ORIGIN = 55.75, 37.62, 150.0
+
+
+@pytest.fixture
+def enu():
+    rng = np.random.default_rng(0)
+    points = rng.uniform(-5000, 5000, (200, 3))
+    points[:, 2] = rng.uniform(-100, 1000, len(points))
+    return points
+
+
+def test_enu2geodetic_matches_scalar_pymap3d(enu):
+    geodetic = LocalFrame(ORIGIN).enu2geodetic(enu)
+    expected = np.array([pm.enu2geodetic(*point, *ORIGIN) for point in enu])
+    np.testing.assert_allclose(geodetic[:, :2], expected[:, :2], rtol=0, atol=1e-12)  # degrees
+    # ECEF rounding differs from the scalar path, altitudes agree to about a nanometer
+    np.testing.assert_allclose(geodetic[:, 2], expected[:, 2], rtol=0, atol=1e-8)
+
+
+def test_geodetic2enu_matches_scalar_pymap3d(enu):
+    geodetic = np.array([pm.enu2geodetic(*point, *ORIGIN) for point in enu])
+    expected = np.array([pm.geodetic2enu(*point, *ORIGIN) for point in geodetic])
+    np.testing.assert_allclose(LocalFrame(ORIGIN).geodetic2enu(geodetic), expected, rtol=0, atol=1e-8)
+
+
+def test_round_trip(enu):
+    frame = LocalFrame(ORIGIN)
+    # Iterative ECEF->geodetic limits the round trip to a few nanometers within 5 km
+    np.testing.assert_allclose(frame.geodetic2enu(frame.enu2geodetic(enu)), enu, rtol=0, atol=1e-8)
+
+
+def test_single_point_keeps_shape():
+    frame = LocalFrame(ORIGIN)
+    geodetic = frame.enu2geodetic([100.0, -200.0, 30.0])
+    assert geodetic.shape == (3,)
+    np.testing.assert_allclose(geodetic, pm.enu2geodetic(100.0, -200.0, 30.0, *ORIGIN), rtol=0, atol=1e-8)
+    np.testing.assert_allclose(frame.geodetic2enu(ORIGIN), 0, atol=1e-8)
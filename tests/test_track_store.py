@@ -0,0 +1,55 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from track_store import TrackStore
+
+START = datetime(2024, 5, 1, 12, 30, 15, 250000)
+
+
+def fill(store: TrackStore, n: int):
+    for i in range(n):
+        dt = START + timedelta(milliseconds=500 * i)
+        store.set(dt, np.arange(2 * store.n_cams) + i, [i, -i, 2.0 * i], [55.0, 37.0, i], manual=i % 2 == 0)
+
+
+def test_round_trip(tmp_path):
+    path = tmp_path / 'session.track'
+    # Small capacity, so that columns grow several times
+    store = TrackStore(3, path, capacity=4)
+    fill(store, 50)
+    store.flush()
+    del store
+
+    store = TrackStore.open(path)
+    assert store.n_cams == 3
+    assert len(store) == 50
+    assert store.datetimes == [START + timedelta(milliseconds=500 * i) for i in range(50)]
+    np.testing.assert_array_equal(store.column('pixels')[7], np.arange(6) + 7)
+    np.testing.assert_array_equal(store.column('enu')[49], [49, -49, 98])
+    assert store.is_manual(START) and not store.is_manual(START + timedelta(milliseconds=500))
+    assert np.isnan(store.column('uncertainty')).all()
+
+    # Reopened store keeps growing and overwrites rows in place
+    store.set(START, np.zeros(6), [1, 2, 3], [4, 5, 6], manual=False)
+    added = START + timedelta(seconds=100)
+    store.set(added, np.ones(6), [0, 0, 0], [0, 0, 0])
+    store.flush()
+    del store
+
+    store = TrackStore.open(path)
+    assert len(store) == 51
+    np.testing.assert_array_equal(store.column('enu')[0], [1, 2, 3])
+    assert not store.is_manual(START)
+    assert store.is_manual(added)
+    assert [row[0] for row in store.rows()] == sorted(store.datetimes)
+
+
+def test_unflushed_rows_are_not_reopened(tmp_path):
+    path = tmp_path / 'session.track'
+    store = TrackStore(2, path)
+    fill(store, 3)
+    store.flush()
+    fill(store, 10)
+    # Length on disk is of the last flush
+    assert len(TrackStore.open(path)) == 3
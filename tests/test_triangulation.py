@@ -0,0 +1,135 @@
+import numpy as np
+import pytest
+
+from benchmarks.scene import make_scene
+from triangulation import Camera, MultiTriangulator, Triangulator, fit_rotation
+
+
+@pytest.fixture
+def scene():
+    return make_scene(n_points=200, n_cams=3)
+
+
+def pixels(scene, cam):
+    # Off the true points, so that rays don't intersect exactly
+    rng = np.random.default_rng(cam)
+    return scene.project(cam, scene.points_world) + rng.normal(0, 0.5, (len(scene.points_world), 2))
+
+
+def test_triangulate_batch_matches_scalar(scene):
+    cam1, cam2, _ = scene.cameras()
+    triangulator = Triangulator(cam1, cam2, scene.cams_world[0], scene.cams_world[1])
+    pix1, pix2 = pixels(scene, 0), pixels(scene, 1)
+
+    world, miss_distance = triangulator.triangulate_batch(pix1, pix2)
+
+    expected = np.array([triangulator.triangulate(p1, p2) for p1, p2 in zip(pix1, pix2)])
+    np.testing.assert_allclose(world, expected, rtol=0, atol=1e-9)
+    assert miss_distance.shape == (len(pix1),)
+    assert (miss_distance > 0).all()
+
+
+def test_multi_triangulator_batch_matches_scalar(scene):
+    triangulator = scene.triangulator()
+    pix = [pixels(scene, c) for c in range(3)]
+
+    world, residual = triangulator.triangulate_batch(*pix)
+
+    expected = np.array([triangulator.triangulate(*points) for points in zip(*pix)])
+    np.testing.assert_allclose(world, expected, rtol=0, atol=1e-9)
+    np.testing.assert_allclose(world, scene.points_world, atol=2.0)
+    assert np.isfinite(residual).all()
+
+
+def test_two_cameras_match_triangulator(scene):
+    # Least squares point of two rays is the middle of their shortest segment
+    cams = scene.cameras()[:2]
+    pix = [pixels(scene, c) for c in range(2)]
+    world, _ = MultiTriangulator(cams, scene.cams_world[:2]).triangulate_batch(*pix)
+    expected, _ = Triangulator(*cams, *scene.cams_world[:2]).triangulate_batch(*pix)
+    np.testing.assert_allclose(world, expected, rtol=0, atol=1e-6)
+
+
+def test_missing_camera(scene):
+    cams = scene.cameras()
+    pix = [pixels(scene, c) for c in range(3)]
+    # The third camera doesn't see the first half of the points, the second one doesn't see the first ten
+    half = len(scene.points_world) // 2
+    pix[2][:half] = np.nan
+    pix[1][:10] = np.nan
+
+    world, residual = MultiTriangulator(cams, scene.cams_world).triangulate_batch(*pix)
+
+    # Seen by one camera only
+    assert np.isnan(world[:10]).all()
+    assert np.isnan(residual[:10]).all()
+    # Seen by the first two cameras, the same as without the third one
+    expected, _ = MultiTriangulator(cams[:2], scene.cams_world[:2]).triangulate_batch(pix[0][10:half], pix[1][10:half])
+    np.testing.assert_allclose(world[10:half], expected, rtol=0, atol=1e-9)
+    assert np.isfinite(world[half:]).all()
+    # Scalar path takes NaN for a missing click as well
+    np.testing.assert_allclose(MultiTriangulator(cams, scene.cams_world).triangulate(pix[0][20], pix[1][20], (np.nan, np.nan)),
+                               world[20], rtol=0, atol=1e-9)
+
+
+def random_rotation(rng) -> np.ndarray:
+    q, r = np.linalg.qr(rng.normal(size=(3, 3)))
+    q *= np.sign(np.diag(r))
+    # Proper rotation, not a reflection
+    return q if np.linalg.det(q) > 0 else -q
+
+
+def test_fit_rotation_recovers_rotation():
+    rng = np.random.default_rng(1)
+    rotation = random_rotation(rng)
+    a = rng.normal(size=(10, 3))
+    a /= np.linalg.norm(a, axis=1, keepdims=True)
+
+    np.testing.assert_allclose(fit_rotation(a, a @ rotation.T), rotation, rtol=0, atol=1e-12)
+
+    # Noisy vectors still give an orthonormal rotation near the true one
+    b = a @ rotation.T + rng.normal(0, 1e-3, a.shape)
+    fitted = fit_rotation(a, b)
+    np.testing.assert_allclose(fitted @ fitted.T, np.eye(3), rtol=0, atol=1e-12)
+    np.testing.assert_allclose(fitted, rotation, rtol=0, atol=5e-3)
+
+
+def test_fit_rotation_stacked():
+    rng = np.random.default_rng(2)
+    rotations = np.array([random_rotation(rng) for _ in range(4)])
+    a = rng.normal(size=(4, 5, 3))
+    fitted = fit_rotation(a, a @ np.swapaxes(rotations, -1, -2))
+    np.testing.assert_allclose(fitted, rotations, rtol=0, atol=1e-12)
+
+
+@pytest.fixture
+def anchored_camera():
+    """Camera of the benchmark scene with four control points, the third one not seen"""
+    scene = make_scene(n_points=4)
+    anchors_world = scene.points_world - scene.cams_world[0]
+    anchors_pix = list(scene.project(0, scene.points_world))
+    anchors_pix[2] = None
+    return scene, Camera(scene.cam_mtx, list(anchors_world), anchors_pix), anchors_pix
+
+
+def test_camera_recovers_orientation(anchored_camera):
+    scene, cam, _ = anchored_camera
+    np.testing.assert_allclose(cam.rotation_mtx_cam2world, scene.rotations_cam2world[0], rtol=0, atol=1e-9)
+
+    residuals = cam.anchor_residuals()
+    assert np.isnan(residuals[2])
+    np.testing.assert_allclose(np.delete(residuals, 2), 0, atol=1e-6)
+
+
+def test_update_anchor_point_matches_new_camera(anchored_camera):
+    scene, cam, anchors_pix = anchored_camera
+    anchors_pix[0] = anchors_pix[0] + [5.0, -3.0]
+    anchors_pix[2] = scene.project(0, scene.points_world[2:3])[0] + [1.0, 1.0]
+    cam.update_anchor_point(0, anchors_pix[0])
+    cam.update_anchor_point(2, anchors_pix[2])
+
+    expected = Camera(scene.cam_mtx, cam.anchors_world, anchors_pix)
+    np.testing.assert_allclose(cam.rotation_mtx_cam2world, expected.rotation_mtx_cam2world, rtol=0, atol=1e-12)
+    np.testing.assert_allclose(cam.anchor_residuals(), expected.anchor_residuals(), rtol=0, atol=1e-9)
+    # Moved anchor no longer fits the others
+    assert cam.anchor_residuals()[0] > 1
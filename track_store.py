@@ -0,0 +1,167 @@
+import json
+import os
+from collections.abc import Iterator
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+from uncertainty import UNCERTAINTY_HEADERS
+
+
+class TrackStore:
+    """Append-only columnar storage of triangulated frames.
+
+    Columns are int64 nanosecond timestamps and float64 undistorted pixels of
+    every camera, ENU and geodetic coordinates and uncertainty estimates (NaN
+    when not estimated, see uncertainty.py), and whether the point was
+    clicked manually rather than tracked. Capacity grows geometrically,
+    so appends are amortized O(1). Rows with an already stored timestamp are
+    overwritten in place.
+
+    If `path` is given, columns are memory-mapped `.npy` files in that
+    directory and the number of valid rows is kept in `meta.json`, so a store
+    is saved incrementally by `flush` and reopened without parsing by `open`.
+    """
+    META_FILE = 'meta.json'
+
+    def __init__(self, n_cams: int, path: str | Path | None = None, capacity=1024) -> None:
+        self.n_cams = n_cams
+        self.path = Path(path) if path is not None else None
+        self._length = 0
+        self._rows: dict[int, int] | None = {}
+        self._columns: dict[str, np.ndarray] = {}
+        if self.path is not None:
+            self.path.mkdir(parents=True, exist_ok=True)
+        for name, shape in self._column_shapes().items():
+            self._columns[name] = self._allocate(name, (capacity, *shape))
+        self.flush()
+
+    def _column_shapes(self) -> dict[str, tuple]:
+        return {'time': (), 'pixels': (2 * self.n_cams,), 'enu': (3,), 'geodetic': (3,), 'uncertainty': (len(UNCERTAINTY_HEADERS),),
+                'manual': ()}
+
+    def _allocate(self, name: str, shape: tuple) -> np.ndarray:
+        dtype = {'time': np.int64, 'manual': np.bool_}.get(name, np.float64)
+        if self.path is None:
+            return np.empty(shape, dtype)
+        return np.lib.format.open_memmap(self.path / f'{name}.npy', 'w+', dtype, shape)
+
+    @classmethod
+    def open(cls, path: str | Path) -> 'TrackStore':
+        """Reopen a store saved on disk, columns are memory-mapped"""
+        path = Path(path)
+        with open(path / cls.META_FILE) as f:
+            meta = json.load(f)
+        store = cls.__new__(cls)
+        store.n_cams = meta['n_cams']
+        store.path = path
+        store._length = meta['length']
+        store._rows = None  # Built on first write
+        store._columns = {}
+        for name, shape in store._column_shapes().items():
+            if (path / f'{name}.npy').exists():
+                store._columns[name] = np.load(path / f'{name}.npy', mmap_mode='r+')
+            else:
+                # Column added after the store was saved, rows of unknown origin are kept as manual
+                store._columns[name] = store._allocate(name, (len(store._columns['time']), *shape))
+                store._columns[name][:] = True if name == 'manual' else np.nan
+        return store
+
+    def __len__(self) -> int:
+        return self._length
+
+    def column(self, name: str) -> np.ndarray:
+        """View of valid rows of column `time`, `pixels`, `enu`, `geodetic`, `uncertainty` or `manual`"""
+        return self._columns[name][:self._length]
+
+    @property
+    def datetimes(self) -> list[datetime]:
+        return self.column('time').astype('datetime64[ns]').astype('datetime64[us]').astype(datetime).tolist()
+
+    def _row(self, dt: datetime) -> tuple[int, int | None]:
+        """Timestamp of `dt` and its row, None if not stored"""
+        time = int(np.datetime64(dt, 'ns').astype(np.int64))
+        if self._rows is None:
+            self._rows = {t: i for i, t in enumerate(self.column('time').tolist())}
+        return time, self._rows.get(time)
+
+    def is_manual(self, dt: datetime) -> bool:
+        """Whether a manually clicked point is stored at `dt`"""
+        _, i = self._row(dt)
+        return i is not None and bool(self._columns['manual'][i])
+
+    def set(self, dt: datetime, pixels, enu, geodetic, uncertainty=None, manual=True) -> int:
+        """Store a frame, returns its row"""
+        time, i = self._row(dt)
+        if i is None:
+            i = self._length
+            if i == len(self._columns['time']):
+                self._grow()
+            self._rows[time] = i
+            self._length += 1
+
+        self._columns['time'][i] = time
+        self._columns['pixels'][i] = pixels
+        self._columns['enu'][i] = enu
+        self._columns['geodetic'][i] = geodetic
+        self._columns['uncertainty'][i] = np.nan if uncertainty is None else uncertainty
+        self._columns['manual'][i] = manual
+        return i
+
+    def set_results(self, enu: np.ndarray, geodetic: np.ndarray, uncertainty: np.ndarray | None = None):
+        """Replace ENU and geodetic coordinates of all rows, uncertainty is cleared if not given"""
+        self.column('enu')[:] = enu
+        self.column('geodetic')[:] = geodetic
+        self.column('uncertainty')[:] = np.nan if uncertainty is None else uncertainty
+
+    def _grow(self):
+        for name, old in self._columns.items():
+            if self.path is None:
+                new = np.empty((2 * len(old), *old.shape[1:]), old.dtype)
+                new[:len(old)] = old
+            else:
+                # Copy into a bigger file next to the old one, then replace it
+                tmp_name = f'{name}.tmp'
+                new = np.lib.format.open_memmap(self.path / f'{tmp_name}.npy', 'w+', old.dtype, (2 * len(old), *old.shape[1:]))
+                new[:len(old)] = old
+                new.flush()
+                del new, old
+                self._columns[name] = None
+                os.replace(self.path / f'{tmp_name}.npy', self.path / f'{name}.npy')
+                new = np.load(self.path / f'{name}.npy', mmap_mode='r+')
+            self._columns[name] = new
+
+    def clear(self):
+        self._length = 0
+        self._rows = {}
+        self.flush()
+
+    def flush(self):
+        """Make stored rows durable on disk (no-op for in-memory stores)"""
+        if self.path is None:
+            return
+        for column in self._columns.values():
+            column.flush()
+        # Length is written last, so a crash never exposes unwritten rows
+        tmp = self.path / f'{self.META_FILE}.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({'n_cams': self.n_cams, 'length': self._length}, f)
+        os.replace(tmp, self.path / self.META_FILE)
+
+    def rows(self, uncertainty=False) -> Iterator[tuple]:
+        """(datetime, e, n, u, lat, lon, alt) rows sorted by time, as exported to text.
+
+        With `uncertainty` the columns of `UNCERTAINTY_HEADERS` are appended.
+        """
+        order = np.argsort(self.column('time'), kind='stable')
+        datetimes = self.datetimes
+        enu = self.column('enu')[order].tolist()
+        geodetic = self.column('geodetic')[order].tolist()
+        extra = self.column('uncertainty')[order].tolist() if uncertainty else [()] * len(order)
+        for i, e, g, u in zip(order.tolist(), enu, geodetic, extra):
+            yield datetimes[i], *e, *g, *u
+
+    def has_uncertainty(self) -> bool:
+        """Whether uncertainty is estimated for any row"""
+        return bool(np.isfinite(self.column('uncertainty')).any())
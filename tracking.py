@@ -0,0 +1,87 @@
+from collections.abc import Callable, Iterator, Sequence
+
+import numpy as np
+
+from frame_index import FrameIndex, FrameReader
+from lazy_import import lazy_import
+
+cv = lazy_import('cv2')
+
+
+def read_gray(reader: FrameReader, frame: int, process: Callable[[np.ndarray], np.ndarray] | None = None) -> np.ndarray | None:
+    """Grayscale frame number `frame` of `reader`, processed the same way as the displayed one"""
+    image = reader.read(frame)
+    if image is None:
+        return None
+    # Undistortion is per channel, a grayscale frame is processed like the displayed RGB one
+    gray = cv.cvtColor(image, cv.COLOR_BGR2GRAY)
+    return gray if process is None else process(gray)
+
+
+class PointTracker:
+    """Tracks a point through video frames with pyramidal Lucas-Kanade optical flow.
+
+    Frames are numbers in the frame `index` of the video and the point is
+    tracked through every decoded frame between the requested ones, so steps
+    are one frame long whatever the distance between requested frames.
+    A step is accepted only if LK reports success, its error is below
+    `max_error`, and tracking the point back to the previous frame lands within
+    `max_fb_error` pixels of where it started (forward-backward check catches
+    drift). Otherwise tracking stops and `lost_reason` tells why.
+    """
+    def __init__(self, video_path: str, process: Callable[[np.ndarray], np.ndarray] | None = None,
+                 index: FrameIndex | None = None, win_size=21, max_level=3, max_error=20.0, max_fb_error=1.0):
+        self.reader = FrameReader(video_path, index)
+        self.process = process
+        self.lk_params = dict(
+            winSize=(win_size, win_size),
+            maxLevel=max_level,
+            criteria=(cv.TERM_CRITERIA_EPS | cv.TERM_CRITERIA_COUNT, 30, 0.01),
+        )
+        self.max_error = max_error
+        self.max_fb_error = max_fb_error
+        self.lost_reason: str | None = None
+
+    def read(self, frame: int) -> np.ndarray | None:
+        return read_gray(self.reader, frame, self.process)
+
+    def _frames_between(self, start: int, end: int) -> Iterator[tuple[int, np.ndarray | None]]:
+        """(number, grayscale frame) of the frames after `start` up to `end`, in either direction"""
+        if end > start:
+            for frame in range(start + 1, end + 1):
+                yield frame, self.read(frame)
+        elif end < start:
+            # Frames are decoded forward only, so the span is decoded first
+            span = range(end, start)
+            yield from reversed(list(zip(span, map(self.read, span))))
+
+    def track(self, frames: Sequence[int], point: tuple[float, float]) -> Iterator[tuple[int, tuple[float, float]]]:
+        """Yield (frame, point) for `frames[1:]` while the point is tracked reliably"""
+        self.lost_reason = None
+        prev = self.read(frames[0])
+        if prev is None:
+            self.lost_reason = f'no frame {frames[0]}'
+            return
+        p0 = np.array([[point]], dtype=np.float32)
+        for start, end in zip(frames, frames[1:]):
+            for frame, image in self._frames_between(start, end):
+                if image is None:
+                    self.lost_reason = f'no frame {frame}'
+                    return
+
+                p1, status, error = cv.calcOpticalFlowPyrLK(prev, image, p0, None, **self.lk_params)
+                if not status[0, 0] or error[0, 0] > self.max_error:
+                    self.lost_reason = f'point lost at frame {frame}'
+                    return
+
+                p0_back, status_back, _ = cv.calcOpticalFlowPyrLK(image, prev, p1, None, **self.lk_params)
+                fb_error = float(np.linalg.norm(p0_back - p0))
+                if not status_back[0, 0] or fb_error > self.max_fb_error:
+                    self.lost_reason = f'drift at frame {frame} ({fb_error:.2f} px)'
+                    return
+                prev, p0 = image, p1
+
+            yield end, tuple(p0[0, 0].tolist())
+
+    def release(self):
+        self.reader.release()
@@ -1,65 +1,210 @@
+from collections.abc import Sequence
+
 import numpy as np
 
 
-def pixel2dirvec(p, cam_mtx):
-    """Преобразование координат в пикселях в направляющий вектор
-    относительно камеры
+def pixels2dirvecs(pixels, cam_mtx_inv):
+    """Пакетное преобразование координат в пикселях (N, 2) в направляющие
+    векторы (N, 3) относительно камеры по заранее обращённой матрице
     """
-    return np.linalg.inv(cam_mtx) @ [*p, 1.0]
+    pixels = np.asarray(pixels, dtype=float).reshape(-1, 2)
+    # (K^-1 @ [u, v, 1]^T)^T = [u, v] @ K^-1[:, :2]^T + K^-1[:, 2]
+    return pixels @ cam_mtx_inv[:, :2].T + cam_mtx_inv[:, 2]
+
 
+def rotation_from_cross_covariance(h):
+    """Ортонормированная матрица поворота R, минимизирующая sum |R a_i - b_i|^2,
+    по матрице h = sum a_i b_i^T (метод Кабша).
 
-def direction_cosine_matrix(a_v1, a_v2, b_v1, b_v2):
-    """Матрица направляющих косинусов, поворачивающая вектор из координатной
-    системы a в координатную систему b
+    Матрицы могут иметь форму (3, 3) или (..., 3, 3)
     """
-    # Определяем третий вектор как векторное произведение
-    a_v12 = np.cross(a_v1, a_v2)
-    b_v12 = np.cross(b_v1, b_v2)
+    u, _, vt = np.linalg.svd(h)
+    # R = V diag(1, 1, d) U^T, где d исключает отражение
+    d = np.sign(np.linalg.det(u) * np.linalg.det(vt))
+    vt[..., 2, :] *= d[..., None]
+    return np.swapaxes(vt, -1, -2) @ np.swapaxes(u, -1, -2)
 
-    # Детерминированная система уравнений
-    a_d = np.array([a_v1, a_v2, a_v12]).T
-    b_d = np.array([b_v1, b_v2, b_v12]).T
 
-    dcm_a2b = b_d @ np.linalg.inv(a_d)
-    return dcm_a2b
+def fit_rotation(a, b):
+    """Поворот, переводящий единичные векторы a (..., K, 3) в b (..., K, 3)
+    с наименьшей суммой квадратов невязок
+    """
+    return rotation_from_cross_covariance(np.swapaxes(a, -1, -2) @ b)
 
 
 def closest_points_along_two_lines(r1, r2, e1, e2):
-    """Возвращает координаты двух точек, образующих кратчайший отрезок между двумя линиями"""
+    """Возвращает координаты двух точек, образующих кратчайший отрезок между двумя линиями.
+
+    Векторы могут иметь форму (3,) или (N, 3) — во втором случае расчёт
+    выполняется сразу для N пар линий
+    """
     n = np.cross(e1, e2)
-    t1 = np.dot(np.cross(e2, n), r2 - r1) / np.dot(n, n)
-    t2 = np.dot(np.cross(e1, n), r2 - r1) / np.dot(n, n)
+    nn = np.sum(n * n, axis=-1, keepdims=True)
+    t1 = np.sum(np.cross(e2, n) * (r2 - r1), axis=-1, keepdims=True) / nn
+    t2 = np.sum(np.cross(e1, n) * (r2 - r1), axis=-1, keepdims=True) / nn
     p1 = r1 + t1 * e1
     p2 = r2 + t2 * e2
     return p1, p2
 
 
+def triangulate_rays(origins, directions):
+    """Точка с минимальной суммой квадратов расстояний до C лучей.
+
+    Начала (..., C, 3) и направления (..., C, 3) лучей; направления луча
+    камеры, не наблюдавшей точку, задаются как NaN. Возвращает точки (..., 3)
+    и среднеквадратичное расстояние (...) от точки до лучей. Для точек,
+    видимых менее чем двумя камерами, и вырожденных систем результат NaN
+    """
+    # Оси камер и координат переносим вперёд: операции идут над большими
+    # непрерывными массивами, а не над осями длиной 2-3
+    shape = np.broadcast_shapes(np.shape(origins), np.shape(directions))
+    e = np.array(np.moveaxis(np.broadcast_to(directions, shape), (-2, -1), (0, 1)), dtype=float, order='C')
+    r0 = np.ascontiguousarray(np.moveaxis(np.broadcast_to(origins, shape), (-2, -1), (0, 1)), dtype=float)
+
+    # Единичные направления лучей
+    e /= np.sqrt(np.sum(e * e, axis=1, keepdims=True))
+    observed = ~np.isnan(e).any(axis=1)
+    e = np.where(observed[:, None], e, 0.0)
+    n_observed = observed.sum(axis=0)
+    r = np.where(observed[:, None], r0, 0.0)
+    ex, ey, ez = e[:, 0], e[:, 1], e[:, 2]
+
+    # Сумма проекторов на плоскости, перпендикулярные лучам: sum(I - e e^T) x = sum(I - e e^T) r.
+    # Матрица симметрична, считаем покомпонентно — для стопок малых матриц это быстрее einsum и solve
+    a00 = n_observed - np.sum(ex * ex, axis=0)
+    a11 = n_observed - np.sum(ey * ey, axis=0)
+    a22 = n_observed - np.sum(ez * ez, axis=0)
+    a01 = -np.sum(ex * ey, axis=0)
+    a02 = -np.sum(ex * ez, axis=0)
+    a12 = -np.sum(ey * ez, axis=0)
+    er = np.sum(e * r, axis=1, keepdims=True)
+    b0, b1, b2 = np.sum(r - e * er, axis=0)
+
+    # Решение через присоединённую матрицу
+    c00 = a11 * a22 - a12 * a12
+    c01 = a02 * a12 - a01 * a22
+    c02 = a01 * a12 - a02 * a11
+    c11 = a00 * a22 - a02 * a02
+    c12 = a01 * a02 - a00 * a12
+    c22 = a00 * a11 - a01 * a01
+    det = a00 * c00 + a01 * c01 + a02 * c02
+    world = np.stack([
+        c00 * b0 + c01 * b1 + c02 * b2,
+        c01 * b0 + c11 * b1 + c12 * b2,
+        c02 * b0 + c12 * b1 + c22 * b2,
+    ])
+    solvable = (n_observed >= 2) & (det != 0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        world /= det
+    world[:, ~solvable] = np.nan
+
+    # Квадраты расстояний от найденной точки до каждого луча
+    d = world - r0
+    dist_sq = np.sum(d * d, axis=1) - np.sum(d * e, axis=1) ** 2
+    # Ошибки округления могут дать малые отрицательные значения
+    residual = np.sqrt(np.sum(dist_sq.clip(0), axis=0, where=observed) / n_observed.clip(1))
+    residual[~solvable] = np.nan
+    return np.moveaxis(world, 0, -1), residual
+
+
 def normalize(v):
     """Нормализованный вектор является последовательностью направляющих косинусов"""
     return v / np.linalg.norm(v)
 
 
 class Camera:
+    """Камера с известными внутренними параметрами, ориентированная по опорным точкам.
+
+    Опорные точки задаются векторами в мировой системе относительно камеры и
+    пикселями на изображении; пиксели точки, не видимой камерой, задаются как
+    None. Поворот находится методом наименьших квадратов по всем видимым
+    точкам (не менее двух) и всегда ортонормирован
+    """
     def __init__(self, mtx, anchors_world, anchors_pix) -> None:
-        assert all(len(points) == 2 for points in (anchors_world, anchors_pix))
+        assert len(anchors_world) == len(anchors_pix)
 
         self.mtx = mtx
-        self.anchors_dirvec_cam = [pixel2dirvec(pix, self.mtx) for pix in anchors_pix]
-        self.anchors_unitvec_cam =[normalize(dirvec) for dirvec in self.anchors_dirvec_cam]
-        self.anchors_unitvec_world = [normalize(cp) for cp in anchors_world]
+        # Обращаем матрицу один раз, а не для каждой точки
+        self.mtx_inv = np.linalg.inv(mtx)
+        self.anchors_world = [np.asarray(cp, dtype=float) for cp in anchors_world]
+        self.anchors_unitvec_world = [normalize(cp) for cp in self.anchors_world]
+        self.anchors_dirvec_cam = [np.full(3, np.nan)] * len(anchors_pix)
+        self.anchors_unitvec_cam = [np.full(3, np.nan)] * len(anchors_pix)
 
-        self.rotation_mtx_cam2world = direction_cosine_matrix(*self.anchors_unitvec_cam, *self.anchors_unitvec_world)
+        # Сумма внешних произведений пар векторов видимых точек, обновляется при перемещении точки
+        self._cross_covariance = np.zeros((3, 3))
+        for index, pix in enumerate(anchors_pix):
+            if pix is not None:
+                self._set_anchor(index, pix)
+        if len(self.observed_anchors) < 2:
+            raise ValueError('Camera needs at least two control points with pixels')
+        self.rotation_mtx_cam2world = rotation_from_cross_covariance(self._cross_covariance)
+        # Таблица лучей пикселей искажённого изображения (ray_lut.RayTable), если загружена
+        self.ray_table = None
 
-    def update_anchor_point(self, index: int, pix):
-        self.anchors_dirvec_cam[index] = pixel2dirvec(pix, self.mtx)
+    @property
+    def observed_anchors(self) -> list[int]:
+        """Индексы опорных точек, видимых камерой"""
+        return [i for i, unitvec in enumerate(self.anchors_unitvec_cam) if not np.isnan(unitvec[0])]
+
+    def _set_anchor(self, index: int, pix):
+        old = self.anchors_unitvec_cam[index]
+        if not np.isnan(old[0]):
+            self._cross_covariance -= np.outer(old, self.anchors_unitvec_world[index])
+        self.anchors_dirvec_cam[index] = self.mtx_inv @ [*pix, 1.0]
         self.anchors_unitvec_cam[index] = normalize(self.anchors_dirvec_cam[index])
-        self.rotation_mtx_cam2world = direction_cosine_matrix(*self.anchors_unitvec_cam, *self.anchors_unitvec_world)
+        self._cross_covariance += np.outer(self.anchors_unitvec_cam[index], self.anchors_unitvec_world[index])
+
+    def update_anchor_point(self, index: int, pix):
+        """Перемещение (или добавление невидимой ранее) опорной точки.
+
+        Обновляется только вклад этой точки, после чего решается задача 3x3
+        """
+        self._set_anchor(index, pix)
+        self.rotation_mtx_cam2world = rotation_from_cross_covariance(self._cross_covariance)
+
+    def anchor_residuals(self) -> np.ndarray:
+        """Расстояния в пикселях между опорными точками и проекциями их мировых
+        координат при найденном повороте; NaN для невидимых точек
+        """
+        world = np.array(self.anchors_world)
+        projected = world @ self.rotation_mtx_cam2world @ self.mtx.T
+        projected = projected[:, :2] / projected[:, 2:]
+        pixels = np.array(self.anchors_dirvec_cam) @ self.mtx.T
+        pixels = pixels[:, :2] / pixels[:, 2:]
+        return np.linalg.norm(projected - pixels, axis=-1)
 
     def pixel2dirvec_world(self, pixel):
-        dirvec_cam = pixel2dirvec(pixel, self.mtx)
+        dirvec_cam = self.mtx_inv @ [*pixel, 1.0]
         dirvec_world = self.rotation_mtx_cam2world @ dirvec_cam
         return dirvec_world
 
+    def pixels2dirvecs_world(self, pixels):
+        """Пакетный вариант `pixel2dirvec_world`: (N, 2) пикселей -> (N, 3) векторов"""
+        # Объединяем внутренние параметры и поворот в одну матрицу
+        pix2world = self.rotation_mtx_cam2world @ self.mtx_inv
+        return pixels2dirvecs(pixels, pix2world)
+
+    def distorted_pixels2dirvecs_world(self, pixels):
+        """Единичные векторы (N, 3) по пикселям (N, 2) искажённого изображения из таблицы лучей.
+
+        Таблица задана относительно камеры и при изменении опорных точек не
+        перестраивается: поворачиваются только найденные лучи
+        """
+        return self.ray_table.lookup(pixels) @ self.rotation_mtx_cam2world.T
+
+    def world2pixels(self, vectors_world):
+        """Проекция (N, 3) векторов в мировой системе относительно камеры на изображение.
+
+        Возвращает пиксели (N, 2) и глубины (N,) вдоль оптической оси;
+        точки с неположительной глубиной находятся позади камеры
+        """
+        vectors_cam = np.asarray(vectors_world, dtype=float).reshape(-1, 3) @ self.rotation_mtx_cam2world
+        depth = vectors_cam[:, 2]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            pixels = (vectors_cam @ self.mtx.T)[:, :2] / depth[:, None]
+        return pixels, depth
+
 
 class Triangulator:
     def __init__(self, cam1: Camera, cam2: Camera, cam1_world, cam2_world) -> None:
@@ -74,3 +219,49 @@ class Triangulator:
         p1_world, p2_world = closest_points_along_two_lines(self.cam1_world, self.cam2_world, p1_dirvec_world, p2_dirvec_world)
         world = np.mean([p1_world, p2_world], axis=0)
         return world
+
+    def triangulate_batch(self, img1_points_pix, img2_points_pix):
+        """Триангуляция сразу N пар пикселей.
+
+        Возвращает точки (N, 3) и расстояния (N,) между двумя лучами (промах)
+        """
+        p1_dirvec_world = self.cam1.pixels2dirvecs_world(img1_points_pix)
+        p2_dirvec_world = self.cam2.pixels2dirvecs_world(img2_points_pix)
+        r1 = np.asarray(self.cam1_world, dtype=float)
+        r2 = np.asarray(self.cam2_world, dtype=float)
+        p1_world, p2_world = closest_points_along_two_lines(r1, r2, p1_dirvec_world, p2_dirvec_world)
+        world = (p1_world + p2_world) / 2
+        miss_distance = np.linalg.norm(p1_world - p2_world, axis=-1)
+        return world, miss_distance
+
+
+class MultiTriangulator:
+    """Триангуляция по произвольному числу камер методом наименьших квадратов.
+
+    Ищется точка с минимальной суммой квадратов расстояний до всех лучей.
+    Пиксели камеры, не наблюдавшей точку, задаются как NaN
+    """
+    def __init__(self, cams: Sequence[Camera], cams_world) -> None:
+        assert len(cams) == len(cams_world) >= 2
+        self.cams = list(cams)
+        self.cams_world = np.asarray(cams_world, dtype=float).reshape(-1, 3)
+
+    def triangulate(self, *imgs_point_pix):
+        world, _ = self.triangulate_batch(*([p] for p in imgs_point_pix))
+        return world[0]
+
+    def triangulate_batch(self, *imgs_points_pix, distorted=False):
+        """Триангуляция N точек: по массиву пикселей (N, 2) на каждую камеру.
+
+        Возвращает точки (N, 3) и среднеквадратичное расстояние (N,) от точки
+        до лучей. Для точек, видимых менее чем двумя камерами, результат NaN.
+        С `distorted` пиксели заданы на искажённых изображениях, лучи берутся
+        из таблиц лучей камер
+        """
+        assert len(imgs_points_pix) == len(self.cams)
+        # Направления лучей (N, C, 3)
+        if distorted:
+            e = np.stack([cam.distorted_pixels2dirvecs_world(pix) for cam, pix in zip(self.cams, imgs_points_pix)], axis=1)
+        else:
+            e = np.stack([cam.pixels2dirvecs_world(pix) for cam, pix in zip(self.cams, imgs_points_pix)], axis=1)
+        return triangulate_rays(self.cams_world, e)
@@ -0,0 +1,51 @@
+from PySide6.QtCore import QObject, QThread, SignalInstance
+
+
+class _Relay(QObject):
+    """Re-emits results of the current generation, lives in the owner's thread"""
+    def __init__(self, owner: 'BackgroundWorker', target: SignalInstance):
+        super().__init__(owner)
+        self._owner = owner
+        self._target = target
+
+    def relay(self, generation: int, *args):
+        if generation == self._owner.generation:
+            self._target.emit(*args)
+
+
+class BackgroundWorker(QObject):
+    """Runs `job`, a QObject, in its own thread.
+
+    Every request gets a new `generation`, and `cancel` makes the running one
+    outdated. Jobs emit results with the generation of their request as the
+    first argument and check `outdated` to stop early. Results connected with
+    `_relay` are re-emitted without it, only for the current generation. The
+    check runs in the thread this object lives in, so results of a cancelled
+    request never arrive.
+    """
+    def __init__(self, job: QObject, parent=None):
+        super().__init__(parent)
+        self.generation = 0
+
+        self._thread = QThread()
+        self._job = job
+        self._job.moveToThread(self._thread)
+        self._thread.start()
+
+    def _relay(self, source: SignalInstance, target: SignalInstance):
+        source.connect(_Relay(self, target).relay)
+
+    def _next_generation(self) -> int:
+        self.generation += 1
+        return self.generation
+
+    def outdated(self, generation: int) -> bool:
+        return generation != self.generation
+
+    def cancel(self):
+        self.generation += 1
+
+    def stop(self):
+        self.cancel()
+        self._thread.quit()
+        self._thread.wait()
@@ -0,0 +1,135 @@
+import sys
+import threading
+
+import numpy as np
+from araviq6 import array2qvideoframe
+from PySide6.QtGui import QImage
+from PySide6.QtMultimedia import QVideoFrame, QVideoFrameFormat
+
+from lazy_import import lazy_import
+
+cv = lazy_import('cv2')
+
+PixelFormat = QVideoFrameFormat.PixelFormat
+# Packed formats converted to RGBX with a single cvtColor
+_PACKED_CONVERSIONS = {
+    PixelFormat.Format_BGRA8888: 'COLOR_BGRA2RGBA',
+    PixelFormat.Format_BGRX8888: 'COLOR_BGRA2RGBA',
+}
+# Formats that are already RGBX in memory
+_RGBX_FORMATS = PixelFormat.Format_RGBA8888, PixelFormat.Format_RGBX8888
+
+
+class FrameBufferStats:
+    """Counts of full-frame allocations and copies in the frame pipeline of all cameras.
+
+    Steady-state playback should only reuse buffers: `allocations` and
+    `copies` stop growing once the frame cache is full.
+    """
+    def __init__(self):
+        self.allocations = 0
+        self.copies = 0
+        self.reuses = 0
+
+    def clear(self):
+        self.allocations = 0
+        self.copies = 0
+        self.reuses = 0
+
+    def summary(self) -> str:
+        return f'buffers: {self.allocations} allocated, {self.copies} copied, {self.reuses} reused'
+
+
+# Shared by all video players
+buffer_stats = FrameBufferStats()
+
+
+class BufferPool:
+    """Preallocated frame buffers, a buffer is reused once nothing but the pool references it.
+
+    Buffers handed out stay busy while any array, view (e.g. a cached frame or
+    a `QImage` wrapping it) refers to them, so a frame is never overwritten
+    while it is cached or displayed. Used from the GUI, processing and
+    prefetching threads.
+    """
+    def __init__(self):
+        self._buffers: list[np.ndarray] = []
+        self._lock = threading.Lock()
+
+    def acquire(self, shape: tuple[int, ...]) -> np.ndarray:
+        with self._lock:
+            for i in range(len(self._buffers)):
+                # References of a free buffer: the pool list and getrefcount's argument
+                if self._buffers[i].shape == shape and sys.getrefcount(self._buffers[i]) == 2:
+                    buffer_stats.reuses += 1
+                    return self._buffers[i]
+            # Free buffers of other sizes are left from a previous video or viewport
+            self._buffers = [b for b in self._buffers if b.shape == shape or sys.getrefcount(b) > 2]
+            buffer = np.empty(shape, np.uint8)
+            self._buffers.append(buffer)
+            buffer_stats.allocations += 1
+            return buffer
+
+    def clear(self):
+        with self._lock:
+            self._buffers = []
+
+
+def _plane(frame: QVideoFrame, plane: int, height: int, width: int, channels=1) -> np.ndarray:
+    """View of a plane of a mapped frame"""
+    stride = frame.bytesPerLine(plane)
+    data = np.frombuffer(frame.bits(plane), np.uint8)
+    return np.lib.stride_tricks.as_strided(data, (height, width, channels), (stride, channels, 1))
+
+
+def map_frame(frame: QVideoFrame, pool: BufferPool) -> np.ndarray:
+    """RGBX array (H, W, 4) of a mapped frame.
+
+    RGBX frames are viewed without copying and stay valid until the frame is
+    unmapped. BGRX and NV12 frames are converted, and YUV420P frames are
+    converted after interleaving their chroma planes, into pooled buffers.
+    Other formats fall back to `QVideoFrame.toImage`, which allocates.
+    """
+    w, h = frame.width(), frame.height()
+    pixel_format = frame.pixelFormat()
+    if pixel_format in _RGBX_FORMATS:
+        return _plane(frame, 0, h, w, 4)
+    if pixel_format in _PACKED_CONVERSIONS:
+        return cv.cvtColor(_plane(frame, 0, h, w, 4), getattr(cv, _PACKED_CONVERSIONS[pixel_format]), dst=pool.acquire((h, w, 4)))
+    if pixel_format == PixelFormat.Format_NV12:
+        y, uv = _plane(frame, 0, h, w)[..., 0], _plane(frame, 1, h // 2, w // 2, 2)
+        return cv.cvtColorTwoPlane(y, uv, cv.COLOR_YUV2RGBA_NV12, dst=pool.acquire((h, w, 4)))
+    if pixel_format == PixelFormat.Format_YUV420P:
+        y = _plane(frame, 0, h, w)[..., 0]
+        uv = pool.acquire((h // 2, w // 2, 2))
+        uv[..., 0] = _plane(frame, 1, h // 2, w // 2)[..., 0]
+        uv[..., 1] = _plane(frame, 2, h // 2, w // 2)[..., 0]
+        buffer_stats.copies += 1  # Chroma planes only
+        return cv.cvtColorTwoPlane(y, uv, cv.COLOR_YUV2RGBA_NV12, dst=pool.acquire((h, w, 4)))
+
+    image = frame.toImage().convertToFormat(QImage.Format.Format_RGBX8888)
+    buffer_stats.allocations += 1
+    buffer_stats.copies += 1
+    array = pool.acquire((h, w, 4))
+    array[:] = np.frombuffer(image.constBits(), np.uint8).reshape(h, image.bytesPerLine())[:, :4 * w].reshape(h, w, 4)
+    return array
+
+
+def wrap_frame(array: np.ndarray, hint: QVideoFrame | None = None) -> QVideoFrame:
+    """Video frame displaying contiguous `array` (H, W, 4) RGBX without copying it.
+
+    `array` must stay referenced while the frame is displayed, so that a
+    `BufferPool` doesn't reuse it. Other arrays are converted by
+    `array2qvideoframe`, which allocates and copies.
+    """
+    if array.ndim != 3 or array.shape[2] != 4 or not array.flags.c_contiguous:
+        buffer_stats.allocations += 1
+        buffer_stats.copies += 1
+        frame = array2qvideoframe(array)
+    else:
+        image = QImage(array.data, array.shape[1], array.shape[0], array.strides[0], QImage.Format.Format_RGBX8888)
+        frame = QVideoFrame(image)
+    if hint is not None:
+        frame.setStartTime(hint.startTime())
+        frame.setEndTime(hint.endTime())
+    return frame
@@ -0,0 +1,171 @@
+import threading
+import traceback
+from collections import OrderedDict
+from collections.abc import Callable, Iterable
+
+import numpy as np
+
+from frame_index import FrameIndex, FrameReader
+from lazy_import import lazy_import
+
+from .frame_buffers import BufferPool
+
+cv = lazy_import('cv2')
+
+
+class FrameCache:
+    """Memory-bounded LRU cache of processed frames keyed by position in milliseconds.
+
+    Thread-safe: frames are put both by the GUI thread and by the prefetcher.
+    """
+    def __init__(self, max_bytes: int = 512 * 1024**2):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._frames: OrderedDict[int, np.ndarray] = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def __contains__(self, pos: int) -> bool:
+        with self._lock:
+            return pos in self._frames
+
+    def __len__(self) -> int:
+        return len(self._frames)
+
+    @property
+    def nbytes(self) -> int:
+        return self._bytes
+
+    def get(self, pos: int) -> np.ndarray | None:
+        with self._lock:
+            frame = self._frames.get(pos)
+            if frame is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._frames.move_to_end(pos)
+            return frame
+
+    def put(self, pos: int, frame: np.ndarray):
+        with self._lock:
+            old = self._frames.pop(pos, None)
+            if old is not None:
+                self._bytes -= old.nbytes
+            if frame.nbytes > self.max_bytes:
+                return
+            self._frames[pos] = frame
+            self._bytes += frame.nbytes
+            self._evict()
+
+    def set_max_bytes(self, max_bytes: int):
+        with self._lock:
+            self.max_bytes = max_bytes
+            self._evict()
+
+    def clear(self):
+        with self._lock:
+            self._frames.clear()
+            self._bytes = 0
+            self.hits = 0
+            self.misses = 0
+
+    def _evict(self):
+        while self._bytes > self.max_bytes:
+            _, frame = self._frames.popitem(last=False)
+            self._bytes -= frame.nbytes
+
+
+class FramePrefetcher:
+    """Decodes and processes frames at requested positions in a background thread.
+
+    Each request replaces the previous one, so only positions around the
+    current slider value are decoded. Positions are mapped to frames through
+    the frame index and decoded exactly, so a prefetched frame is the one the
+    player shows at the position. Results are put into `cache` as RGBX
+    arrays, converted into buffers of `pool` if given. Opening a video or
+    changing the processing clears the cache, frames decoded before are dropped.
+    Frames are decoded outside the lock, so requests never wait for a decode.
+    """
+    def __init__(self, cache: FrameCache, pool: BufferPool | None = None):
+        self.cache = cache
+        self.pool = pool
+        self._video: tuple[str, FrameIndex] | None = None
+        self._process: Callable[[np.ndarray], np.ndarray] | None = None
+        self._queue: list[int] = []
+        self._generation = 0
+        self._condition = threading.Condition()
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def open(self, file_path: str, index: FrameIndex, process: Callable[[np.ndarray], np.ndarray] | None):
+        """Prefetch frames of the video with frame `index`"""
+        with self._condition:
+            # Opened by the prefetching thread, which also releases the reader of the previous video
+            self._video = file_path, index
+            self._process = process
+            self._clear()
+
+    def set_process(self, process: Callable[[np.ndarray], np.ndarray] | None):
+        with self._condition:
+            self._process = process
+            self._clear()
+
+    def _clear(self):
+        self._queue = []
+        self._generation += 1
+        self.cache.clear()
+
+    def request(self, positions: Iterable[int]):
+        with self._condition:
+            self._queue = [pos for pos in positions if pos not in self.cache]
+            self._condition.notify()
+
+    def stop(self):
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+        self._thread.join()
+
+    def _run(self):
+        reader: FrameReader | None = None
+        video = None
+        # Reused by the decoder for frames of the same size
+        decoded = None
+        while True:
+            with self._condition:
+                while not self._queue and not self._stopped:
+                    self._condition.wait()
+                if self._stopped:
+                    break
+                pos = self._queue.pop(0)
+                requested, process, generation = self._video, self._process, self._generation
+
+            try:
+                if requested is not video:
+                    if reader is not None:
+                        reader.release()
+                    reader, video, decoded = FrameReader(*requested), requested, None
+                image = reader.read(reader.index.nearest(pos), decoded)
+                if image is None:
+                    continue
+                decoded = image
+
+                # Qt pipeline works with RGBX arrays, they are displayed without conversion
+                dst = None if self.pool is None else self.pool.acquire((*decoded.shape[:2], 4))
+                frame = cv.cvtColor(decoded, cv.COLOR_BGR2RGBA, dst=dst)
+                if process is not None:
+                    frame = process(frame)
+            except Exception:
+                # A broken frame must not stop prefetching for the rest of the session
+                traceback.print_exc()
+                continue
+
+            with self._condition:
+                # Processed for a previous video or in a previous mode
+                if generation == self._generation:
+                    self.cache.put(pos, frame)
+
+        if reader is not None:
+            reader.release()
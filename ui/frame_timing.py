@@ -0,0 +1,82 @@
+import json
+import threading
+import time
+from collections import defaultdict, deque
+
+import numpy as np
+
+STAGES = 'seek', 'convert', 'undistort', 'wrap', 'display', 'total'
+
+
+class FrameTimings:
+    """Per-stage timings of the frame pipeline of all cameras.
+
+    Disabled by default: callers check `enabled` before taking timestamps, so
+    the disabled cost is a single attribute lookup per stage. Keeps the last
+    `window` durations of each stage for percentiles and the last
+    `trace_capacity` events for a Chrome trace (chrome://tracing, Perfetto).
+    """
+    def __init__(self, window=300, trace_capacity=100_000):
+        self.enabled = False
+        self._durations: defaultdict[tuple[str, str], deque[int]] = defaultdict(lambda: deque(maxlen=window))
+        self._trace: deque[tuple[str, str, int, int]] = deque(maxlen=trace_capacity)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def now() -> int:
+        return time.perf_counter_ns()
+
+    def record(self, cam: str, stage: str, start: int, end: int | None = None):
+        """Record a stage of camera `cam` that lasted from `start` to `end` (now by default) nanoseconds"""
+        if end is None:
+            end = time.perf_counter_ns()
+        with self._lock:
+            self._durations[cam, stage].append(end - start)
+            self._trace.append((cam, stage, start, end))
+
+    def clear(self):
+        with self._lock:
+            self._durations.clear()
+            self._trace.clear()
+
+    def percentiles(self, cam: str, stage: str, q=(50, 95)) -> np.ndarray | None:
+        """Percentiles of stage durations in milliseconds"""
+        with self._lock:
+            durations = list(self._durations.get((cam, stage), ()))
+        if not durations:
+            return None
+        return np.percentile(durations, q) / 1e6
+
+    def summary(self, cams) -> str:
+        """Compact p50/p95 summary of every stage, e.g. `cam1 seek 12/20 undistort 25/31 ms`"""
+        parts = []
+        for cam in cams:
+            stages = []
+            for stage in STAGES:
+                p = self.percentiles(cam, stage)
+                if p is not None:
+                    stages.append(f'{stage} {p[0]:.0f}/{p[1]:.0f}')
+            if stages:
+                parts.append(f'{cam}: ' + ' '.join(stages))
+        return ' | '.join(parts) + ' ms (p50/p95)' if parts else ''
+
+    def save_trace(self, file_path: str):
+        """Save recorded events in Chrome trace event format, one thread row per camera"""
+        with self._lock:
+            trace = list(self._trace)
+        cams = sorted({cam for cam, *_ in trace})
+        events = [
+            {'name': 'thread_name', 'ph': 'M', 'pid': 0, 'tid': cams.index(cam), 'args': {'name': cam}}
+            for cam in cams
+        ]
+        for cam, stage, start, end in trace:
+            events.append({
+                'name': stage, 'cat': 'frame', 'ph': 'X', 'pid': 0, 'tid': cams.index(cam),
+                'ts': start / 1000, 'dur': (end - start) / 1000,
+            })
+        with open(file_path, 'w') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+
+
+# Shared by all video players
+frame_timings = FrameTimings()
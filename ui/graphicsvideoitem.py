@@ -10,14 +10,24 @@ class GraphicsVideoItem(QGraphicsVideoItem):
     def __init__(self, parent: QGraphicsItem | None = None) -> None:
         super().__init__(parent)
         self.setCursor(Qt.CursorShape.CrossCursor)
+        # Native pixels per video pixel, e.g. 2 for a half-resolution proxy
+        self.pixel_scale = 1.0
 
         self.nativeSizeChanged.connect(self._match_pixels)
 
     def mousePressEvent(self, event: QGraphicsSceneMouseEvent) -> None:
         if event.button() is Qt.MouseButton.LeftButton:
-            self.mouse_pressed.emit(event.pos())
+            # Scene coordinates are native pixels even if the item shows only a part of the frame
+            self.mouse_pressed.emit(event.scenePos())
         return super().mousePressEvent(event)
 
+    def set_geometry(self, x: float, y: float, pixel_scale: float):
+        """Place the item at native pixel (x, y) with `pixel_scale` native pixels per video pixel"""
+        self.setPos(x, y)
+        if pixel_scale != self.pixel_scale:
+            self.pixel_scale = pixel_scale
+            self._match_pixels()
+
     def _match_pixels(self):
         # Bring item's size to native video size so that the mouse position represents pixel in the video
-        self.setSize(self.nativeSize())
+        self.setSize(self.nativeSize() * self.pixel_scale)
@@ -1,10 +1,13 @@
-from PySide6.QtCore import Qt
-from PySide6.QtGui import QMouseEvent, QWheelEvent
+from PySide6.QtCore import QRectF, Qt, Signal
+from PySide6.QtGui import QMouseEvent, QResizeEvent, QWheelEvent
 from PySide6.QtWidgets import QGraphicsItem, QGraphicsView
 
 
 class GraphicsView(QGraphicsView):
 
+    # Zoom, pan or resize changed the visible part of the scene
+    view_changed = Signal()
+
     def __init__(self, parent):
         super().__init__(parent)
         self._zoom_factor = 1
@@ -21,16 +24,26 @@ class GraphicsView(QGraphicsView):
 
         self._zoom_factor *= zoom_factor
         self.scale(zoom_factor, zoom_factor)
+        self.view_changed.emit()
         event.accept()
 
-    def fitInView(self, item: QGraphicsItem, aspectRatioMode: Qt.AspectRatioMode):
+    def fitInView(self, rect: QRectF | QGraphicsItem, aspectRatioMode: Qt.AspectRatioMode):
         viewport_center_scene = self.mapToScene(self.viewport().rect().center())
-        super().fitInView(item, aspectRatioMode)
+        super().fitInView(rect, aspectRatioMode)
         self._fitInView_scale_x = self.transform().m11()
         self._fitInView_scale_y = self.transform().m22()
 
         self.scale(self._zoom_factor, self._zoom_factor)  # Restore zoom
         self.centerOn(viewport_center_scene)
+        self.view_changed.emit()
+
+    def scrollContentsBy(self, dx: int, dy: int) -> None:
+        super().scrollContentsBy(dx, dy)
+        self.view_changed.emit()
+
+    def resizeEvent(self, event: QResizeEvent) -> None:
+        super().resizeEvent(event)
+        self.view_changed.emit()
 
     def mousePressEvent(self, event: QMouseEvent) -> None:
         if event.button() == Qt.MouseButton.RightButton:
@@ -1,22 +1,30 @@
 from collections import defaultdict
 from collections.abc import Callable, Sequence
 from datetime import datetime, timedelta
-from math import floor
+from math import ceil, floor, sqrt
 
-from PySide6.QtCore import QFileInfo, QPointF, Qt, Signal
+from PySide6.QtCore import QFileInfo, QPointF, Qt, QTimer, Signal
 from PySide6.QtGui import QCloseEvent, QIcon, QKeyEvent
-from PySide6.QtWidgets import QMainWindow
+from PySide6.QtWidgets import QFileDialog, QLabel, QMainWindow, QProgressBar
 
-from videosync import intersection
+from frame_index import FrameIndex
+from proxy import Proxy
+from videosync import intersection, nearest_frames
 
+from .frame_buffers import buffer_stats
+from .frame_timing import frame_timings
 from .uic.main_window import Ui_MainWindow
 from .unprocessed_video_window import UnprocessedVideoWindow
+from .video_player import VideoPlayer
 
 
 class MainWindow(QMainWindow):
 
     closed = Signal()
-    both_frames_clicked = Signal(datetime, QPointF, QPointF)
+    # Points clicked in all views: datetime, position in every view
+    all_frames_clicked = Signal(datetime, list)
+    # Only one of the views is clicked: datetime, camera id, position
+    point_clicked = Signal(datetime, int, QPointF)
     anchor_clicked = Signal(int, int, QPointF)
 
     def __init__(self):
@@ -25,34 +33,121 @@ class MainWindow(QMainWindow):
         self.ui.setupUi(self)
         self.setWindowIcon(QIcon('res/coordinates.png'))
 
-        self.cams = self.ui.cam1, self.ui.cam2
-
-        for i, cam in enumerate(self.cams):
-            cam.loaded.connect(self.on_duration_available)
-            cam.mouse_pressed.connect(lambda click_pos, i=i: self._handle_click(i, click_pos))
+        # One view per camera of the session, created when its videos are opened
+        self.cams: list[VideoPlayer] = []
+        self._frame_cache_size: int | None = None
 
         self.single_step = 500  # in milliseconds
+        self.prefetch_steps = 3  # slider steps decoded ahead in each direction
         self.ui.horizontal_slider.valueChanged.connect(self._on_slider_value_changed)
 
         # Unprocessed video
         self.unprocessed_video_window = UnprocessedVideoWindow()
         self.ui.action_show_unprocessed_video.toggled.connect(self.unprocessed_video_window.setVisible)
         self.unprocessed_video_window.closed.connect(lambda: self.ui.action_show_unprocessed_video.setChecked(False))
-        for cam, cam_unprocessed in zip(self.cams, self.unprocessed_video_window.cams):
-            cam._video_sink_raw.videoFrameChanged.connect(lambda f, cam_unprocessed=cam_unprocessed: cam_unprocessed.videoSink().setVideoFrame(f))
 
-        self._is_editing_anchor = [False, False]
+        self.ui.action_undistort_frames.toggled.connect(self._set_undistort_frames)
+
+        # Frame pipeline timing summary
+        self._timing_label = QLabel()
+        self.ui.statusbar.addPermanentWidget(self._timing_label)
+        self._timing_timer = QTimer(self, interval=1000)
+        self._timing_timer.timeout.connect(self._show_timings)
+        self.ui.action_time_frames.toggled.connect(self._set_frame_timing)
+        self.ui.action_save_frame_trace.triggered.connect(self._save_frame_trace)
+
+        # Session loading progress
+        self._progress_bar = QProgressBar(maximumWidth=200, visible=False)
+        self.ui.statusbar.addPermanentWidget(self._progress_bar)
+
+        # Index of the control point edited while its number key (1-9) is held
+        self._editing_anchor: int | None = None
+        # Match proposed in the view that isn't clicked yet: datetime, camera id, position
+        self._proposal: tuple[datetime, int, QPointF] | None = None
+
+    def _set_cam_count(self, n: int):
+        """Show `n` views in a grid of as many columns as rows or one more"""
+        while len(self.cams) > n:
+            cam = self.cams.pop()
+            self.ui.cams_layout.removeWidget(cam)
+            # Stops its frame processing and prefetching
+            cam.close()
+            cam.deleteLater()
+        while len(self.cams) < n:
+            i = len(self.cams)
+            cam = VideoPlayer(self.ui.cams_widget)
+            cam.setObjectName(f'cam{i + 1}')
+            cam.set_undistort_frames(self.ui.action_undistort_frames.isChecked())
+            if self._frame_cache_size is not None:
+                cam.set_cache_size(self._frame_cache_size)
+            cam.loaded.connect(self.on_duration_available)
+            cam.mouse_pressed.connect(lambda click_pos, i=i: self._handle_click(i, click_pos))
+            cam._video_sink_raw.videoFrameChanged.connect(lambda f, i=i: self._show_unprocessed(i, f))
+            self.cams.append(cam)
+
+        columns = ceil(sqrt(n))
+        for i, cam in enumerate(self.cams):
+            # Added anew, so that a view doesn't keep its cell of a previous grid
+            self.ui.cams_layout.removeWidget(cam)
+            self.ui.cams_layout.addWidget(cam, *divmod(i, columns))
+        self.unprocessed_video_window.set_cam_count(n)
+
+    def _set_undistort_frames(self, enabled: bool):
+        for cam in self.cams:
+            cam.set_undistort_frames(enabled)
+
+    def _show_unprocessed(self, cam_id: int, frame):
+        # Hidden window doesn't need to convert frames for display
+        if self.unprocessed_video_window.isVisible():
+            self.unprocessed_video_window.cams[cam_id].videoSink().setVideoFrame(frame)
+
+    def _set_frame_timing(self, enabled: bool):
+        frame_timings.clear()
+        buffer_stats.clear()
+        frame_timings.enabled = enabled
+        self._timing_label.clear()
+        if enabled:
+            self._timing_timer.start()
+        else:
+            self._timing_timer.stop()
 
-    def open_files(self, videos: Sequence[str], undistorters: Sequence[Callable]):
-        self.clicked_points: defaultdict[datetime, list[QPointF | None]] = defaultdict(lambda: [None, None])
+    def _show_timings(self):
+        summary = frame_timings.summary(cam.objectName() for cam in self.cams)
+        self._timing_label.setText(f'{summary} | {buffer_stats.summary()}' if summary else buffer_stats.summary())
 
-        for video, cam, undistorter in zip(videos, self.cams, undistorters):
+    def _save_frame_trace(self):
+        file_path, _ = QFileDialog.getSaveFileName(self, dir='frame_trace.json', filter='Chrome trace (*.json)')
+        if file_path:
+            frame_timings.save_trace(file_path)
+
+    def show_progress(self, message: str, step: int, steps: int):
+        """Show progress of a background task, hidden once `step` reaches `steps`"""
+        done = step >= steps
+        self._progress_bar.setVisible(not done)
+        self._progress_bar.setRange(0, steps)
+        self._progress_bar.setValue(step)
+        if done:
+            self.ui.statusbar.clearMessage()
+        else:
+            self.ui.statusbar.showMessage(f'{message}...')
+
+    def open_files(self, videos: Sequence[str], undistorters: Sequence[Callable], proxies: Sequence[Proxy | None] | None = None,
+                   frame_indexes: Sequence[FrameIndex] | None = None):
+        # Before views are removed, the proposal may be marked in one of them
+        self._clear_proposal()
+        self._set_cam_count(len(videos))
+        self.clicked_points: defaultdict[datetime, list[QPointF | None]] = defaultdict(lambda: [None] * len(self.cams))
+        self.show_progress('', 1, 1)
+
+        proxies = proxies or [None] * len(videos)
+        frame_indexes = frame_indexes or [None] * len(videos)
+        for video, cam, undistorter, proxy, frame_index in zip(videos, self.cams, undistorters, proxies, frame_indexes):
             video_file_info = QFileInfo(video)
             if not video_file_info.exists():
                 raise FileExistsError(video)
             
             video_start = datetime.strptime(video_file_info.completeBaseName()[:23], '%Y-%m-%d_%H-%M-%S.%f')
-            cam.open_video(video_file_info, video_start, undistorter)
+            cam.open_video(video_file_info, video_start, undistorter, proxy, frame_index)
 
     def on_duration_available(self):
         # Check if all videos are loaded
@@ -60,14 +155,12 @@ class MainWindow(QMainWindow):
             if cam.duration is None:
                 return
 
-        starts = self.ui.cam1.start, self.ui.cam2.start
-        durations = timedelta(milliseconds=self.ui.cam1.duration), timedelta(milliseconds=self.ui.cam2.duration)
+        # Videos end with their last real frame, not with the reported duration
+        starts = [cam.start for cam in self.cams]
+        durations = [timedelta(milliseconds=cam.frame_index.last) for cam in self.cams]
         self.start, self.end = intersection(starts, durations)
-
-        # !!! Костыль !!! Qt почему-то возвращал битый кадр при переходе на
-        # последнюю миллисекунду в одном из записанных видео.
-        self.end -= timedelta(milliseconds=1)
         self.duration = self.end - self.start
+        self.sync_residual = timedelta()
 
         slider_max_value = floor((self.duration.total_seconds() * 1000) / self.single_step)
         self.ui.horizontal_slider.setMaximum(slider_max_value)
@@ -77,11 +170,48 @@ class MainWindow(QMainWindow):
     def _go_to(self, dt: datetime):
         if dt < self.start or dt > self.end:
             raise IndexError(f'datetime {dt} out of range [{self.start} - {self.end}]')
-        self.ui.cam1.go_to(dt)
-        self.ui.cam2.go_to(dt)
+        frames, self.sync_residual = self._pair_frames(dt)
+        for cam, frame_dt in zip(self.cams, frames):
+            cam.go_to(frame_dt)
+        self._prefetch(dt)
+
+    def _pair_frames(self, dt: datetime) -> tuple[list[datetime], timedelta]:
+        """Frames of all cameras nearest to `dt` and their time offset"""
+        return nearest_frames(dt, [cam.start for cam in self.cams], [cam.frame_index for cam in self.cams])
+
+    def frame_numbers(self, dt: datetime) -> list[int]:
+        """Numbers of the frames of all cameras paired at `dt`"""
+        frames, _ = self._pair_frames(dt)
+        return [cam.frame_index.nearest((frame_dt - cam.start) / timedelta(milliseconds=1)) for cam, frame_dt in zip(self.cams, frames)]
+
+    def _prefetch(self, dt: datetime):
+        # Nearest positions first, alternating forward and backward
+        frames = []
+        for i in range(1, self.prefetch_steps + 1):
+            for sign in 1, -1:
+                neighbour = dt + sign * i * timedelta(milliseconds=self.single_step)
+                if self.start <= neighbour <= self.end:
+                    frames.append(self._pair_frames(neighbour)[0])
+        for cam, dts in zip(self.cams, zip(*frames)):
+            cam.prefetch(dts)
+
+    def slider_datetimes(self, dt: datetime, forward=True, max_steps: int | None = None) -> list[datetime]:
+        """Slider positions from `dt` (included) towards the end or the start of the video"""
+        step = timedelta(milliseconds=self.single_step) * (1 if forward else -1)
+        dts = []
+        while self.start <= dt <= self.end and (max_steps is None or len(dts) <= max_steps):
+            dts.append(dt)
+            dt += step
+        return dts
+
+    def set_frame_cache_size(self, max_bytes: int):
+        self._frame_cache_size = max_bytes
+        for cam in self.cams:
+            cam.set_cache_size(max_bytes)
 
     def _on_slider_value_changed(self, value):
         self.current = self.start + timedelta(milliseconds=value*self.single_step)
+        self._clear_proposal()
         print(self.current)
         self._go_to(self.current)
         self._report()
@@ -94,38 +224,53 @@ class MainWindow(QMainWindow):
         self._report()
 
         # Check if we are editing anchor points
-        for anchor_id, is_editing in enumerate(self._is_editing_anchor):
-            if is_editing:
-                self.anchor_clicked.emit(cam_id, anchor_id, click_pos)
-                return
+        if self._editing_anchor is not None:
+            self.anchor_clicked.emit(cam_id, self._editing_anchor, click_pos)
+            return
 
+        self._clear_proposal()
         self.clicked_points[self.current][cam_id] = click_pos
-        # Emit signal only if both frames have been clicked
+        # Emit signal only if all frames have been clicked
         if None in self.clicked_points[self.current]:
+            self.point_clicked.emit(self.current, cam_id, click_pos)
             return
-        self.both_frames_clicked.emit(self.current, *self.clicked_points[self.current])
+        self.all_frames_clicked.emit(self.current, list(self.clicked_points[self.current]))
+
+    def propose_point(self, dt: datetime, cam_id: int, pos: QPointF, confidence: float):
+        """Mark a match proposed for view `cam_id`, Enter accepts it as a click"""
+        if dt != self.current or self.clicked_points[dt][cam_id] is not None:
+            return
+        self._clear_proposal()
+        self._proposal = dt, cam_id, pos
+        self.cams[cam_id].show_marker(pos)
+        self.ui.statusbar.showMessage(f'Match proposed in view {cam_id + 1}, confidence {confidence:.2f}: Enter to accept, click to correct')
+
+    def accept_proposal(self):
+        if self._proposal is not None and self._proposal[0] == self.current:
+            _, cam_id, pos = self._proposal
+            self._handle_click(cam_id, pos)
+
+    def _clear_proposal(self):
+        if self._proposal is not None:
+            self.cams[self._proposal[1]].show_marker(None)
+            self._proposal = None
 
     def _report(self):
         timestamp = self.current.strftime('%Y-%m-%d_%H-%M-%S.%f')[:-3]
-        msg = timestamp
+        residual_ms = self.sync_residual / timedelta(milliseconds=1)
+        msg = f'{timestamp}  sync offset {residual_ms:.1f} ms'
         # points = self.clicked_points[self.current]
         # msg = f'{timestamp} {points[0].toTuple()} {points[1].toTuple()}'
         self.ui.statusbar.showMessage(msg)
 
     def keyPressEvent(self, event: QKeyEvent):
-        if not event.isAutoRepeat():
-            match event.key():
-                case Qt.Key.Key_1:
-                    self._is_editing_anchor[0] = True
-                case Qt.Key.Key_2:
-                    self._is_editing_anchor[1] = True
+        if event.key() in (Qt.Key.Key_Return, Qt.Key.Key_Enter):
+            self.accept_proposal()
+        if not event.isAutoRepeat() and Qt.Key.Key_1 <= event.key() <= Qt.Key.Key_9:
+            self._editing_anchor = event.key() - Qt.Key.Key_1
         return super().keyPressEvent(event)
 
     def keyReleaseEvent(self, event):
-        if not event.isAutoRepeat():
-            match event.key():
-                case Qt.Key.Key_1:
-                    self._is_editing_anchor[0] = False
-                case Qt.Key.Key_2:
-                    self._is_editing_anchor[1] = False
+        if not event.isAutoRepeat() and event.key() - Qt.Key.Key_1 == self._editing_anchor:
+            self._editing_anchor = None
         return super().keyReleaseEvent(event)
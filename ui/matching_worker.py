@@ -0,0 +1,91 @@
+from collections import OrderedDict
+from collections.abc import Callable
+from datetime import datetime
+
+import numpy as np
+from PySide6.QtCore import QObject, Signal
+
+from correspondence import EpipolarMatcher
+from frame_index import FrameReader
+from tracking import read_gray
+from triangulation import Camera
+
+from .background import BackgroundWorker
+
+# Video path, frame number, undistortion callback, camera and its position
+View = tuple[str, int, Callable[[np.ndarray], np.ndarray], Camera, np.ndarray]
+
+
+class _MatchingJob(QObject):
+    """Runs in the matching thread"""
+    matched = Signal(int, datetime, int, object)
+    failed = Signal(int, str)
+
+    def __init__(self, owner: 'MatchingWorker'):
+        super().__init__()
+        self._owner = owner
+        # Recently searched videos, seeking an open capture is faster than opening it again
+        self._readers: OrderedDict[str, FrameReader] = OrderedDict()
+        self.max_open_videos = 6
+
+    def run(self, generation: int, frame_datetime: datetime, cam_id: int, views: list, pixel: tuple):
+        if self._owner.outdated(generation):
+            return
+        images = [read_gray(self._reader(path), frame, process) for path, frame, process, _, _ in views]
+        if self._owner.outdated(generation):
+            return
+        if any(image is None for image in images):
+            self.failed.emit(generation, 'no frame')
+            return
+
+        (_, _, _, cam_a, origin_a), (_, _, _, cam_b, origin_b) = views
+        matcher = self._owner.matcher
+        match = matcher.match(*images, cam_a, origin_a, pixel, cam_b, origin_b)
+        if match is None:
+            self.failed.emit(generation, matcher.failure_reason)
+        else:
+            self.matched.emit(generation, frame_datetime, cam_id, match)
+
+    def _reader(self, path: str) -> FrameReader:
+        if path in self._readers:
+            self._readers.move_to_end(path)
+            return self._readers[path]
+        # Least recently searched, e.g. of a previous session
+        while len(self._readers) >= self.max_open_videos:
+            _, reader = self._readers.popitem(last=False)
+            reader.release()
+        reader = self._readers[path] = FrameReader(path)
+        return reader
+
+    def release(self):
+        for reader in self._readers.values():
+            reader.release()
+        self._readers.clear()
+
+
+class MatchingWorker(BackgroundWorker):
+    """Searches a point clicked in one camera along its epipolar line in the other one off the GUI thread.
+
+    `matched` reports (frame datetime, camera id, `Match`) of the camera where
+    the match was found, `failed` why none was. Both signals are emitted in
+    the thread this object lives in. Starting a new search discards the
+    result of the previous one.
+    """
+    matched = Signal(datetime, int, object)
+    failed = Signal(str)
+    _start_requested = Signal(int, datetime, int, list, tuple)
+
+    def __init__(self, parent=None):
+        super().__init__(_MatchingJob(self), parent)
+        self.matcher = EpipolarMatcher()
+        self._start_requested.connect(self._job.run)
+        self._relay(self._job.matched, self.matched)
+        self._relay(self._job.failed, self.failed)
+
+    def start(self, frame_datetime: datetime, cam_id: int, clicked: View, other: View, pixel: tuple[float, float]):
+        """Search `pixel` of the `clicked` view, in undistorted pixels, in the `other` view of camera `cam_id`"""
+        self._start_requested.emit(self._next_generation(), frame_datetime, cam_id, [clicked, other], tuple(pixel))
+
+    def stop(self):
+        super().stop()
+        self._job.release()
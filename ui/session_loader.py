@@ -0,0 +1,94 @@
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from PySide6.QtCore import QObject, Signal
+
+from frame_index import FrameIndex
+from proxy import Proxy, find_proxy, proxy_dir
+from session import Session
+
+from .background import BackgroundWorker
+
+
+@dataclass
+class LoadedSession:
+    session: Session
+    frame_indexes: list[FrameIndex]
+    proxies: list[Proxy | None]
+    # Duration of every loading step in milliseconds
+    timings: dict[str, float] = field(default_factory=dict)
+
+
+class _LoadingJob(QObject):
+    """Runs in the loading thread"""
+    progress = Signal(str, int, int)
+    loaded = Signal(int, object)
+    failed = Signal(int, str)
+
+    def __init__(self, owner: 'SessionLoader'):
+        super().__init__()
+        self._owner = owner
+
+    def run(self, generation: int, file_path: str, cam_keys: list):
+        try:
+            loaded = self._load(generation, file_path, cam_keys or None)
+        except Exception as e:
+            self.failed.emit(generation, f'{type(e).__name__}: {e}')
+            return
+        if loaded is not None:
+            self.loaded.emit(generation, loaded)
+
+    def _load(self, generation: int, file_path: str, cam_keys: list | None) -> LoadedSession | None:
+        timings = {}
+        start = time.perf_counter()
+        self.progress.emit(f'Reading {Path(file_path).name}', 0, 1)
+        # Also imports OpenCV and pymap3d on first load
+        session = Session(file_path, cam_keys)
+        timings['session'] = (time.perf_counter() - start) * 1000
+
+        steps = 1 + 2 * len(session.videos)
+        frame_indexes = []
+        proxies = []
+        for i, (video, undistorter) in enumerate(zip(session.videos, session.undistorters)):
+            if self._owner.outdated(generation):
+                return None
+            name = Path(video).name
+            start = time.perf_counter()
+            self.progress.emit(f'Indexing frames of {name}', 1 + 2 * i, steps)
+            frame_indexes.append(FrameIndex.load(video))
+            timings[f'index {name}'] = (time.perf_counter() - start) * 1000
+
+            start = time.perf_counter()
+            self.progress.emit(f'Looking for proxy of {name}', 2 + 2 * i, steps)
+            proxies.append(find_proxy(proxy_dir(session), video, undistorter))
+            timings[f'proxy {name}'] = (time.perf_counter() - start) * 1000
+        return LoadedSession(session, frame_indexes, proxies, timings)
+
+
+class SessionLoader(BackgroundWorker):
+    """Loads a session with everything needed to open its videos off the GUI thread.
+
+    Parsing the session, indexing video frames (a full scan the first time a
+    video is opened) and looking up proxies can take seconds, so the window
+    stays responsive meanwhile. `progress` reports (message, step, steps),
+    `loaded` the `LoadedSession` and `failed` the error message. All signals
+    are emitted in the thread this object lives in. Starting a new load
+    discards the result of the previous one.
+    """
+    progress = Signal(str, int, int)
+    loaded = Signal(object)
+    failed = Signal(str)
+    _load_requested = Signal(int, str, list)
+
+    def __init__(self, parent=None):
+        super().__init__(_LoadingJob(self), parent)
+        self._load_requested.connect(self._job.run)
+        # Signal to signal connection is queued back to this object's thread
+        self._job.progress.connect(self.progress)
+        self._relay(self._job.loaded, self.loaded)
+        self._relay(self._job.failed, self.failed)
+
+    def load(self, file_path: str, cam_keys=None):
+        """Load cameras `cam_keys` of the session, else those of its `cams` list"""
+        self._load_requested.emit(self._next_generation(), str(file_path), list(cam_keys or ()))
@@ -0,0 +1,79 @@
+from collections.abc import Callable, Sequence
+from datetime import datetime
+
+from PySide6.QtCore import QObject, QPointF, Signal
+
+from frame_index import FrameIndex
+from tracking import PointTracker
+
+from .background import BackgroundWorker
+
+
+class _TrackingJob(QObject):
+    """Runs in the tracking thread"""
+    point_tracked = Signal(int, datetime, list)
+    finished = Signal(int, str)
+
+    def __init__(self, owner: 'TrackingWorker'):
+        super().__init__()
+        self._owner = owner
+
+    def run(self, generation: int, videos: list, forward: list, backward: list, points: list):
+        if self._owner.outdated(generation):
+            return
+        trackers = [PointTracker(path, process, index) for path, index, process in videos]
+        reasons = []
+        for steps in forward, backward:
+            reasons.append(self._track(generation, trackers, steps, points))
+        for tracker in trackers:
+            tracker.release()
+        self.finished.emit(generation, '; '.join(reasons))
+
+    def _track(self, generation: int, trackers: list[PointTracker], steps: list[tuple[datetime, list[int]]], points: list) -> str:
+        if len(steps) < 2:
+            return 'nothing to track'
+
+        dts = [dt for dt, _ in steps]
+        tracks = [
+            tracker.track([frames[i] for _, frames in steps], point)
+            for i, (tracker, point) in enumerate(zip(trackers, points))
+        ]
+        # Cameras are advanced in lockstep, the shortest track stops all of them
+        for dt, steps in zip(dts[1:], zip(*tracks)):
+            if self._owner.outdated(generation):
+                return 'cancelled'
+            self.point_tracked.emit(generation, dt, [QPointF(*point) for _, point in steps])
+
+        for tracker in trackers:
+            if tracker.lost_reason is not None:
+                return tracker.lost_reason
+        return f'tracked until {dts[-1]}'
+
+
+class TrackingWorker(BackgroundWorker):
+    """Tracks a clicked point in all cameras forward and backward off the GUI thread.
+
+    The point is tracked through every frame, every slider position where it
+    was tracked in all cameras is emitted by `point_tracked`. `finished`
+    reports why tracking stopped. Both signals are emitted in the thread this
+    object lives in.
+    """
+    point_tracked = Signal(datetime, list)
+    finished = Signal(str)
+    _start_requested = Signal(int, list, list, list, list)
+
+    def __init__(self, parent=None):
+        super().__init__(_TrackingJob(self), parent)
+        self._start_requested.connect(self._job.run)
+        self._relay(self._job.point_tracked, self.point_tracked)
+        self._relay(self._job.finished, self.finished)
+
+    def start(self, videos: Sequence[tuple[str, FrameIndex, Callable | None]],
+              forward: Sequence[tuple[datetime, list[int]]], backward: Sequence[tuple[datetime, list[int]]],
+              points: Sequence[QPointF]):
+        """Track `points` clicked at the first step of `forward` and `backward` along both sequences.
+
+        Steps are (slider datetime, frame number of each camera), `videos`
+        holds (video path, frame index, frame processing callback) for each camera.
+        """
+        self._start_requested.emit(self._next_generation(), list(videos), list(forward), list(backward), [p.toTuple() for p in points])
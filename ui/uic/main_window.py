@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+
+################################################################################
+## Form generated from reading UI file 'main_window.ui'
+##
+## Created by: Qt User Interface Compiler version 6.8.2
+##
+## WARNING! All changes made in this file will be lost when recompiling UI file!
+################################################################################
+
+from PySide6.QtCore import (QCoreApplication, QDate, QDateTime, QLocale,
+    QMetaObject, QObject, QPoint, QRect,
+    QSize, QTime, QUrl, Qt)
+from PySide6.QtGui import (QAction, QBrush, QColor, QConicalGradient,
+    QCursor, QFont, QFontDatabase, QGradient,
+    QIcon, QImage, QKeySequence, QLinearGradient,
+    QPainter, QPalette, QPixmap, QRadialGradient,
+    QTransform)
+from PySide6.QtWidgets import (QApplication, QGridLayout, QMainWindow, QMenu,
+    QMenuBar, QSizePolicy, QSlider, QStatusBar,
+    QWidget)
+
+class Ui_MainWindow(object):
+    def setupUi(self, MainWindow):
+        if not MainWindow.objectName():
+            MainWindow.setObjectName(u"MainWindow")
+        MainWindow.resize(800, 600)
+        self.action_open_file = QAction(MainWindow)
+        self.action_open_file.setObjectName(u"action_open_file")
+        self.action_export_data = QAction(MainWindow)
+        self.action_export_data.setObjectName(u"action_export_data")
+        self.action_show_unprocessed_video = QAction(MainWindow)
+        self.action_show_unprocessed_video.setObjectName(u"action_show_unprocessed_video")
+        self.action_show_unprocessed_video.setCheckable(True)
+        self.action_time_frames = QAction(MainWindow)
+        self.action_time_frames.setObjectName(u"action_time_frames")
+        self.action_time_frames.setCheckable(True)
+        self.action_save_frame_trace = QAction(MainWindow)
+        self.action_save_frame_trace.setObjectName(u"action_save_frame_trace")
+        self.action_track_points = QAction(MainWindow)
+        self.action_track_points.setObjectName(u"action_track_points")
+        self.action_track_points.setCheckable(True)
+        self.action_match_points = QAction(MainWindow)
+        self.action_match_points.setObjectName(u"action_match_points")
+        self.action_match_points.setCheckable(True)
+        self.action_match_points.setChecked(True)
+        self.action_estimate_uncertainty = QAction(MainWindow)
+        self.action_estimate_uncertainty.setObjectName(u"action_estimate_uncertainty")
+        self.action_estimate_uncertainty.setCheckable(True)
+        self.action_undistort_frames = QAction(MainWindow)
+        self.action_undistort_frames.setObjectName(u"action_undistort_frames")
+        self.action_undistort_frames.setCheckable(True)
+        self.action_undistort_frames.setChecked(True)
+        self.centralwidget = QWidget(MainWindow)
+        self.centralwidget.setObjectName(u"centralwidget")
+        self.gridLayout = QGridLayout(self.centralwidget)
+        self.gridLayout.setObjectName(u"gridLayout")
+        self.cams_widget = QWidget(self.centralwidget)
+        self.cams_widget.setObjectName(u"cams_widget")
+        self.cams_layout = QGridLayout(self.cams_widget)
+        self.cams_layout.setObjectName(u"cams_layout")
+        self.cams_layout.setContentsMargins(0, 0, 0, 0)
+
+        self.gridLayout.addWidget(self.cams_widget, 0, 0, 1, 1)
+
+        self.horizontal_slider = QSlider(self.centralwidget)
+        self.horizontal_slider.setObjectName(u"horizontal_slider")
+        self.horizontal_slider.setOrientation(Qt.Orientation.Horizontal)
+
+        self.gridLayout.addWidget(self.horizontal_slider, 1, 0, 1, 1)
+
+        MainWindow.setCentralWidget(self.centralwidget)
+        self.menubar = QMenuBar(MainWindow)
+        self.menubar.setObjectName(u"menubar")
+        self.menubar.setGeometry(QRect(0, 0, 800, 33))
+        self.menuFile = QMenu(self.menubar)
+        self.menuFile.setObjectName(u"menuFile")
+        self.menuOptions = QMenu(self.menubar)
+        self.menuOptions.setObjectName(u"menuOptions")
+        MainWindow.setMenuBar(self.menubar)
+        self.statusbar = QStatusBar(MainWindow)
+        self.statusbar.setObjectName(u"statusbar")
+        MainWindow.setStatusBar(self.statusbar)
+
+        self.menubar.addAction(self.menuFile.menuAction())
+        self.menubar.addAction(self.menuOptions.menuAction())
+        self.menuFile.addAction(self.action_open_file)
+        self.menuFile.addAction(self.action_export_data)
+        self.menuOptions.addAction(self.action_show_unprocessed_video)
+        self.menuOptions.addAction(self.action_undistort_frames)
+        self.menuOptions.addAction(self.action_track_points)
+        self.menuOptions.addAction(self.action_match_points)
+        self.menuOptions.addAction(self.action_estimate_uncertainty)
+        self.menuOptions.addSeparator()
+        self.menuOptions.addAction(self.action_time_frames)
+        self.menuOptions.addAction(self.action_save_frame_trace)
+
+        self.retranslateUi(MainWindow)
+
+        QMetaObject.connectSlotsByName(MainWindow)
+    # setupUi
+
+    def retranslateUi(self, MainWindow):
+        MainWindow.setWindowTitle(QCoreApplication.translate("MainWindow", u"Image Triangulation", None))
+        self.action_open_file.setText(QCoreApplication.translate("MainWindow", u"Open", None))
+        self.action_export_data.setText(QCoreApplication.translate("MainWindow", u"Export", None))
+        self.action_show_unprocessed_video.setText(QCoreApplication.translate("MainWindow", u"Show unprocessed video", None))
+        self.action_time_frames.setText(QCoreApplication.translate("MainWindow", u"Time frame pipeline", None))
+#if QT_CONFIG(tooltip)
+        self.action_time_frames.setToolTip(QCoreApplication.translate("MainWindow", u"Measure seek, conversion, undistortion and display time of every frame", None))
+#endif // QT_CONFIG(tooltip)
+        self.action_save_frame_trace.setText(QCoreApplication.translate("MainWindow", u"Save frame trace...", None))
+        self.action_track_points.setText(QCoreApplication.translate("MainWindow", u"Track clicked points", None))
+#if QT_CONFIG(tooltip)
+        self.action_track_points.setToolTip(QCoreApplication.translate("MainWindow", u"Track a point clicked in all views forward and backward with optical flow", None))
+#endif // QT_CONFIG(tooltip)
+        self.action_match_points.setText(QCoreApplication.translate("MainWindow", u"Propose matches", None))
+#if QT_CONFIG(tooltip)
+        self.action_match_points.setToolTip(QCoreApplication.translate("MainWindow", u"Search a point clicked in one view along its epipolar line in another view and propose the best match", None))
+#endif // QT_CONFIG(tooltip)
+        self.action_estimate_uncertainty.setText(QCoreApplication.translate("MainWindow", u"Estimate uncertainty", None))
+#if QT_CONFIG(tooltip)
+        self.action_estimate_uncertainty.setToolTip(QCoreApplication.translate("MainWindow", u"Estimate covariance of triangulated points by Monte Carlo simulation of pixel, anchor and camera position errors", None))
+#endif // QT_CONFIG(tooltip)
+        self.action_undistort_frames.setText(QCoreApplication.translate("MainWindow", u"Undistort frames", None))
+#if QT_CONFIG(tooltip)
+        self.action_undistort_frames.setToolTip(QCoreApplication.translate("MainWindow", u"Undistort whole frames. When disabled, raw frames are shown and only clicked points are undistorted", None))
+#endif // QT_CONFIG(tooltip)
+        self.menuFile.setTitle(QCoreApplication.translate("MainWindow", u"File", None))
+        self.menuOptions.setTitle(QCoreApplication.translate("MainWindow", u"Options", None))
+    # retranslateUi
+
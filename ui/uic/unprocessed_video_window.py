@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+
+################################################################################
+## Form generated from reading UI file 'unprocessed_video_window.ui'
+##
+## Created by: Qt User Interface Compiler version 6.8.2
+##
+## WARNING! All changes made in this file will be lost when recompiling UI file!
+################################################################################
+
+from PySide6.QtCore import (QCoreApplication, QDate, QDateTime, QLocale,
+    QMetaObject, QObject, QPoint, QRect,
+    QSize, QTime, QUrl, Qt)
+from PySide6.QtGui import (QBrush, QColor, QConicalGradient, QCursor,
+    QFont, QFontDatabase, QGradient, QIcon,
+    QImage, QKeySequence, QLinearGradient, QPainter,
+    QPalette, QPixmap, QRadialGradient, QTransform)
+from PySide6.QtWidgets import (QApplication, QGridLayout, QSizePolicy, QWidget)
+
+class Ui_UnprocessedVideoWindow(object):
+    def setupUi(self, UnprocessedVideoWindow):
+        if not UnprocessedVideoWindow.objectName():
+            UnprocessedVideoWindow.setObjectName(u"UnprocessedVideoWindow")
+        UnprocessedVideoWindow.resize(800, 600)
+        self.cams_layout = QGridLayout(UnprocessedVideoWindow)
+        self.cams_layout.setObjectName(u"cams_layout")
+
+        self.retranslateUi(UnprocessedVideoWindow)
+
+        QMetaObject.connectSlotsByName(UnprocessedVideoWindow)
+    # setupUi
+
+    def retranslateUi(self, UnprocessedVideoWindow):
+        UnprocessedVideoWindow.setWindowTitle(QCoreApplication.translate("UnprocessedVideoWindow", u"Unprocessed Video", None))
+    # retranslateUi
+
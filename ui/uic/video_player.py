@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+
+################################################################################
+## Form generated from reading UI file 'video_player.ui'
+##
+## Created by: Qt User Interface Compiler version 6.8.2
+##
+## WARNING! All changes made in this file will be lost when recompiling UI file!
+################################################################################
+
+from PySide6.QtCore import (QCoreApplication, QDate, QDateTime, QLocale,
+    QMetaObject, QObject, QPoint, QRect,
+    QSize, QTime, QUrl, Qt)
+from PySide6.QtGui import (QBrush, QColor, QConicalGradient, QCursor,
+    QFont, QFontDatabase, QGradient, QIcon,
+    QImage, QKeySequence, QLinearGradient, QPainter,
+    QPalette, QPixmap, QRadialGradient, QTransform)
+from PySide6.QtWidgets import (QApplication, QGraphicsView, QLabel, QSizePolicy,
+    QVBoxLayout, QWidget)
+
+from ui.graphicsview import GraphicsView
+
+class Ui_VideoPlayer(object):
+    def setupUi(self, VideoPlayer):
+        if not VideoPlayer.objectName():
+            VideoPlayer.setObjectName(u"VideoPlayer")
+        VideoPlayer.resize(400, 300)
+        self.verticalLayout = QVBoxLayout(VideoPlayer)
+        self.verticalLayout.setObjectName(u"verticalLayout")
+        self.verticalLayout.setContentsMargins(0, 0, 0, 0)
+        self.labelVideoFileName = QLabel(VideoPlayer)
+        self.labelVideoFileName.setObjectName(u"labelVideoFileName")
+
+        self.verticalLayout.addWidget(self.labelVideoFileName)
+
+        self.graphicsView = GraphicsView(VideoPlayer)
+        self.graphicsView.setObjectName(u"graphicsView")
+        self.graphicsView.setTransformationAnchor(QGraphicsView.ViewportAnchor.AnchorUnderMouse)
+
+        self.verticalLayout.addWidget(self.graphicsView)
+
+
+        self.retranslateUi(VideoPlayer)
+
+        QMetaObject.connectSlotsByName(VideoPlayer)
+    # setupUi
+
+    def retranslateUi(self, VideoPlayer):
+        VideoPlayer.setWindowTitle(QCoreApplication.translate("VideoPlayer", u"Form", None))
+        self.labelVideoFileName.setText(QCoreApplication.translate("VideoPlayer", u"Video File Name", None))
+    # retranslateUi
+
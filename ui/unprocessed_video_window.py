@@ -1,5 +1,8 @@
+from math import ceil, sqrt
+
 from PySide6.QtCore import Qt, Signal
 from PySide6.QtGui import QCloseEvent
+from PySide6.QtMultimediaWidgets import QVideoWidget
 from PySide6.QtWidgets import QWidget
 
 from .uic.unprocessed_video_window import Ui_UnprocessedVideoWindow
@@ -14,7 +17,22 @@ class UnprocessedVideoWindow(QWidget):
         self.ui = Ui_UnprocessedVideoWindow()
         self.ui.setupUi(self)
 
-        self.cams = self.ui.cam1, self.ui.cam2
+        self.cams: list[QVideoWidget] = []
+
+    def set_cam_count(self, n: int):
+        """Show `n` videos laid out like the views of the main window"""
+        while len(self.cams) > n:
+            cam = self.cams.pop()
+            self.ui.cams_layout.removeWidget(cam)
+            cam.deleteLater()
+        while len(self.cams) < n:
+            self.cams.append(QVideoWidget(self))
+
+        columns = ceil(sqrt(n))
+        for i, cam in enumerate(self.cams):
+            # Added anew, so that a view doesn't keep its cell of a previous grid
+            self.ui.cams_layout.removeWidget(cam)
+            self.ui.cams_layout.addWidget(cam, *divmod(i, columns))
 
     def closeEvent(self, event: QCloseEvent) -> None:
         return self.closed.emit()
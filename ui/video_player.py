@@ -1,17 +1,97 @@
+from collections import deque
+from collections.abc import Callable, Iterable
 from datetime import datetime
+from math import ceil, floor, log2
 
+import numpy as np
 from araviq6 import VideoFrameProcessor, VideoFrameWorker
-from PySide6.QtCore import QFileInfo, QPointF, Qt, Signal
-from PySide6.QtGui import QCloseEvent, QResizeEvent
-from PySide6.QtMultimedia import QMediaPlayer, QVideoSink
-from PySide6.QtWidgets import QGraphicsScene, QWidget
+from PySide6.QtCore import QFileInfo, QPointF, QRectF, Qt, QTimer, Signal
+from PySide6.QtGui import QCloseEvent, QPen, QResizeEvent
+from PySide6.QtMultimedia import QMediaPlayer, QVideoFrame, QVideoSink
+from PySide6.QtWidgets import QGraphicsEllipseItem, QGraphicsItem, QGraphicsScene, QWidget
 
+from frame_index import FrameIndex
+from proxy import Proxy
+
+from .frame_buffers import BufferPool, buffer_stats, map_frame, wrap_frame
+from .frame_cache import FrameCache, FramePrefetcher
+from .frame_timing import frame_timings
 from .graphicsvideoitem import GraphicsVideoItem
 from .uic.video_player import Ui_VideoPlayer
 
 
+class TimedVideoFrameWorker(VideoFrameWorker):
+    """Frame worker that maps decoded frames without copying, processes them into buffers of `pool`
+    and wraps the result for display without copying.
+
+    Frames are processed by the callback of `set_process`, results are
+    emitted by `frameProcessed` with the generation of the callback they were
+    processed with. Records conversion, processing and wrapping times when
+    timing is enabled.
+    """
+    frameProcessed = Signal(QVideoFrame, np.ndarray, int)
+
+    def __init__(self, pool: BufferPool, parent=None):
+        super().__init__(parent)
+        self.name = ''
+        self.pool = pool
+        self._process: tuple[Callable[[np.ndarray], np.ndarray], int] = _unprocessed, 0
+
+    def set_process(self, process: Callable[[np.ndarray], np.ndarray], generation: int):
+        """Process frames with `process`, called from any thread"""
+        # Replaced as a whole, a frame is always processed and tagged consistently
+        self._process = process, generation
+
+    def runProcess(self, frame: QVideoFrame):
+        process, generation = self._process
+        self._ready = False
+        # Frames that can't be mapped go through QVideoFrame.toImage
+        if not frame.map(QVideoFrame.MapMode.ReadOnly):
+            processedArray = process(self.imageToArray(frame.toImage()))
+            self.frameProcessed.emit(self.arrayToVideoFrame(processedArray, frame), processedArray, generation)
+            self._ready = True
+            return
+
+        t0 = frame_timings.now()
+        try:
+            array = map_frame(frame, self.pool)
+            t1 = frame_timings.now()
+            processedArray = process(array)
+            # A view of the mapped frame is invalid once it's unmapped
+            if not array.flags.owndata and np.may_share_memory(processedArray, array):
+                copy = self.pool.acquire(processedArray.shape)
+                copy[:] = processedArray
+                buffer_stats.copies += 1
+                processedArray = copy
+            t2 = frame_timings.now()
+        finally:
+            frame.unmap()
+        processedFrame = wrap_frame(processedArray, frame)
+        if frame_timings.enabled:
+            t3 = frame_timings.now()
+            frame_timings.record(self.name, 'convert', t0, t1)
+            frame_timings.record(self.name, 'undistort', t1, t2)
+            frame_timings.record(self.name, 'wrap', t2, t3)
+
+        self.frameProcessed.emit(processedFrame, processedArray, generation)
+        self._ready = True
+
+
+def _unprocessed(array: np.ndarray) -> np.ndarray:
+    return array
+
+
+class RegionFrame(np.ndarray):
+    """Processed frame covering `region` (x, y, scale) of the native undistorted frame"""
+    region: tuple[int, int, float] | None = None
+
+    def __array_finalize__(self, obj):
+        self.region = getattr(obj, 'region', None)
+
+
 class VideoPlayer(QWidget):
     loaded = Signal()
+    frame_displayed = Signal()
     mouse_pressed = Signal(QPointF)
 
     def __init__(self, parent):
@@ -24,56 +104,325 @@ class VideoPlayer(QWidget):
         # Processed video frames are displayed here
         self._graphics_video_item = GraphicsVideoItem()
 
-        # Frame processing
-        self._frame_worker = VideoFrameWorker()
+        # Frame processing, frames are converted and undistorted into reused buffers
+        self._buffer_pool = BufferPool()
+        self._frame_worker = TimedVideoFrameWorker(self._buffer_pool)
         self._frame_processor = VideoFrameProcessor()
+        # Frames are submitted one at a time here, a busy worker doesn't drop them
+        self._frame_processor.setSkipIfRunning(False)
         self._frame_processor.setWorker(self._frame_worker)
-        self._frame_processor.videoFrameProcessed.connect(lambda f: self._graphics_video_item.videoSink().setVideoFrame(f))
+        # The processor relays every result twice, results are taken from the worker
+        self._frame_worker.frameProcessed.connect(self._on_frame_processed)
+        # A frame of the current processing is in the worker
+        self._processing = False
+        # Only the latest frame waits while the worker is busy
+        self._waiting_frame: QVideoFrame | None = None
+        # Changed with the processing, frames processed before a change are dropped
+        self._process_generation = 0
+
+        # Processed frames are cached so that going back to a seen position doesn't decode it again
+        self.frame_cache = FrameCache()
+        self._prefetcher = FramePrefetcher(self.frame_cache, self._buffer_pool)
+        self._showing_cached = False
+        # Start of the current seek for timing, 0 when not timed
+        self._seek_started = 0
+        # Arrays of recently displayed frames, kept so that the pool doesn't overwrite them while shown
+        self._displayed: deque[np.ndarray] = deque(maxlen=3)
 
-        self._video_sink_raw.videoFrameChanged.connect(self._frame_processor.processVideoFrame)
+        # When disabled, raw frames are displayed and only clicked points get undistorted
+        self.undistort_frames = True
+        self._undistorter = None
+        self._proxy: Proxy | None = None
+        self._current: datetime | None = None
+        self._video_sink_raw.videoFrameChanged.connect(self._on_raw_frame)
+
+        # Live undistortion covers only the visible part of the frame at display resolution
+        self.viewport_processing = True
+        self.viewport_margin = 0.25  # of the visible size on each side
+        self._frame_size: tuple[int, int] | None = None  # native undistorted frame
+        self._region: tuple[int, int, int, int, float] | None = None  # x, y, width, height, scale
+        self._viewport_timer = QTimer(self, singleShot=True, interval=100)
+        self._viewport_timer.timeout.connect(self._update_viewport)
+        self.ui.graphicsView.view_changed.connect(self._viewport_timer.start)
         
         self._graphics_scene = QGraphicsScene(self.ui.graphicsView)
         self._graphics_scene.addItem(self._graphics_video_item)
         self.ui.graphicsView.setScene(self._graphics_scene)
 
-        self._player = QMediaPlayer(self)
-        self._player.setVideoOutput(self._video_sink_raw)
+        # Proposed match, the same size on screen at any zoom
+        self._marker = QGraphicsEllipseItem(-8, -8, 16, 16)
+        self._marker.setPen(QPen(Qt.GlobalColor.yellow, 2))
+        self._marker.setFlag(QGraphicsItem.GraphicsItemFlag.ItemIgnoresTransformations)
+        self._marker.setAcceptedMouseButtons(Qt.MouseButton.NoButton)
+        self._marker.setZValue(1)
+        self._marker.setVisible(False)
+        self._graphics_scene.addItem(self._marker)
+
+        # Created with the first video, initializing the multimedia backend is slow
+        self._player: QMediaPlayer | None = None
 
         # Styling
         self._graphics_scene.setBackgroundBrush(Qt.GlobalColor.gray)
 
-        self._graphics_video_item.nativeSizeChanged.connect(self.fit2video)
-        self._player.metaDataChanged.connect(self._on_metadata_changed)
         self._graphics_video_item.mouse_pressed.connect(self.mouse_pressed.emit)
 
-    def open_video(self, video: QFileInfo, start: datetime, undistorter):
+    def open_video(self, video: QFileInfo, start: datetime, undistorter, proxy: Proxy | None = None,
+                   frame_index: FrameIndex | None = None):
+        """Open video, `proxy` is its pre-rendered undistorted version played instead when frames are undistorted.
+
+        `frame_index` of the video is loaded if not given.
+        """
+        if self._player is None:
+            self._player = QMediaPlayer(self)
+            self._player.setVideoOutput(self._video_sink_raw)
+            self._player.metaDataChanged.connect(self._on_metadata_changed)
+        self._video = video
+        self._proxy = proxy
+        self.duration = None
+        # Real frame timestamps, so that seeks land exactly on frames
+        self.frame_index = frame_index or FrameIndex.load(video.filePath())
+        self._undistorter = undistorter
+        self._frame_worker.name = self.objectName()
+        self._frame_size = None
+        self._region = None
+        self._open_source()
+        self.ui.labelVideoFileName.setText(video.fileName())
+        self.start = start
+
+    @property
+    def _playing_proxy(self) -> bool:
+        return self._proxy is not None and self.undistort_frames
+
+    def _open_source(self):
+        file_path = self._proxy.file_path if self._playing_proxy else self._video.filePath()
         # Block signals so that frame processor doesn't get None as a frame
         self._video_sink_raw.blockSignals(True)
-        self._player.setSource(video.filePath())
+        self._player.setSource(file_path)
         self._video_sink_raw.blockSignals(False)
         self._player.pause()
 
-        self.duration = None
-        self._frame_worker.processArray = undistorter
-        self.ui.labelVideoFileName.setText(video.fileName())
-        self.start = start
+        self._set_frame_process()
+        index = self._proxy.frame_index() if self._playing_proxy else self.frame_index
+        # Clears the cache
+        self._prefetcher.open(file_path, index, self._frame_process())
+
+    @property
+    def _source_pixel_scale(self) -> float:
+        """Native pixels per pixel of decoded frames"""
+        return 1 / self._proxy.scale if self._playing_proxy else 1.0
 
     def resizeEvent(self, event: QResizeEvent) -> None:
         self.fit2video()
         return super().resizeEvent(event)
     
     def fit2video(self):
-        self.ui.graphicsView.fitInView(self._graphics_video_item, Qt.AspectRatioMode.IgnoreAspectRatio)
+        # Fit the whole frame, the item may cover only its visible part
+        target = QRectF(0, 0, *self._frame_size) if self._frame_size else self._graphics_video_item
+        self.ui.graphicsView.fitInView(target, Qt.AspectRatioMode.IgnoreAspectRatio)
+
+    def _visible_rect(self) -> tuple[QRectF, float]:
+        """Visible part of the frame in native pixels and the display scale"""
+        view = self.ui.graphicsView
+        frame = QRectF(0, 0, *self._frame_size)
+        visible = view.mapToScene(view.viewport().rect()).boundingRect() & frame
+        if visible.isEmpty():
+            visible = frame
+
+        transform = view.transform()
+        view_scale = max(transform.m11(), transform.m22())
+        # Quantized up to quarter octaves, so that small zoom steps reuse the region
+        scale = 1.0 if view_scale >= 1 else 2 ** (ceil(log2(view_scale) * 4) / 4)
+        return visible, scale
+
+    def _update_viewport(self):
+        if not self.viewport_processing or self._frame_size is None or not self.undistort_frames or self._playing_proxy:
+            return
+        visible, scale = self._visible_rect()
+        if self._region is not None:
+            x, y, w, h, region_scale = self._region
+            # Keep the processed region while the visible part stays inside it
+            if region_scale == scale and QRectF(x, y, w, h).contains(visible):
+                return
+
+        mx = visible.width() * self.viewport_margin
+        my = visible.height() * self.viewport_margin
+        x0 = max(0, floor(visible.left() - mx))
+        y0 = max(0, floor(visible.top() - my))
+        x1 = min(self._frame_size[0], ceil(visible.right() + mx))
+        y1 = min(self._frame_size[1], ceil(visible.bottom() + my))
+        self._region = x0, y0, x1 - x0, y1 - y0, scale
+        # Cached frames cover the previous region, they are dropped with the new processing
+        self._set_frame_process()
+        self._prefetcher.set_process(self._frame_process())
+        if self._current is not None:
+            self.go_to(self._current)
     
     def _on_metadata_changed(self):
         self.duration = self._player.duration()
         self.loaded.emit()
 
-    def go_to(self, dt: datetime):
+    def _dt2pos(self, dt: datetime) -> int:
         target = dt - self.start
-        pos = round(target.total_seconds() * 1000)
+        frame = self.frame_index.nearest(target.total_seconds() * 1000)
+        # Proxy has the same frames at a constant frame rate
+        frame_pos = self._proxy.position(frame) if self._playing_proxy else float(self.frame_index.timestamps[frame])
+        # Player shows the frame whose timestamp is the last one not after the position,
+        # rounding down could land on the previous frame
+        return ceil(frame_pos)
+
+    def go_to(self, dt: datetime):
+        self._current = dt
+        self._seek_started = frame_timings.now() if frame_timings.enabled else 0
+        pos = self._dt2pos(dt)
+        frame = self.frame_cache.get(pos)
+        if frame is not None:
+            self._showing_cached = True
+            self._display(wrap_frame(frame), frame)
+            return
+
+        self._showing_cached = False
         self._player.setPosition(pos)
 
+    def _display(self, frame: QVideoFrame, array: np.ndarray | None = None):
+        if array is not None:
+            self._displayed.append(array)
+        region = getattr(array, 'region', None)
+        if region is None:
+            self._graphics_video_item.set_geometry(0, 0, self._source_pixel_scale)
+        else:
+            x, y, scale = region
+            self._graphics_video_item.set_geometry(x, y, 1 / scale)
+
+        if not frame_timings.enabled:
+            self._graphics_video_item.videoSink().setVideoFrame(frame)
+            self.frame_displayed.emit()
+            return
+
+        name = self.objectName()
+        start = frame_timings.now()
+        self._graphics_video_item.videoSink().setVideoFrame(frame)
+        frame_timings.record(name, 'display', start)
+        if self._seek_started:
+            frame_timings.record(name, 'total', self._seek_started)
+            self._seek_started = 0
+        self.frame_displayed.emit()
+
+    def show_marker(self, pos: QPointF | None):
+        """Mark native pixel `pos` of the frame, hide the marker if None"""
+        if pos is not None:
+            self._marker.setPos(pos)
+        self._marker.setVisible(pos is not None)
+
+    def prefetch(self, dts: Iterable[datetime]):
+        """Decode and process frames at `dts` in background, nearest first"""
+        self._prefetcher.request(self._dt2pos(dt) for dt in dts)
+
+    def set_undistort_frames(self, enabled: bool):
+        self.undistort_frames = enabled
+        if self._player is None:
+            return
+        self._showing_cached = False
+        if self._proxy is not None:
+            # Switch between the proxy and the original video and redisplay the current frame
+            self._open_source()
+            if self._current is not None:
+                self.go_to(self._current)
+            return
+        # Cached frames were processed in the other mode, they are dropped with the new processing
+        self._set_frame_process()
+        self._prefetcher.set_process(self._frame_process())
+        # Redisplay current frame in the new mode
+        if self._current is not None:
+            self.go_to(self._current)
+
+    def _set_frame_process(self):
+        self._process_generation += 1
+        # Frames are processed only while undistorting, a late frame of another mode is processed unchanged
+        self._frame_worker.set_process(self._frame_process() or _unprocessed, self._process_generation)
+        # A frame in the worker was submitted with the previous processing, its result is dropped
+        self._processing = False
+        self._waiting_frame = None
+
+    def _frame_process(self):
+        # Proxy frames are already undistorted
+        if not self.undistort_frames or self._playing_proxy:
+            return None
+        undistorter = self._undistorter
+        pool = self._buffer_pool
+        if not self.viewport_processing or self._region is None:
+            def undistort(array: np.ndarray) -> np.ndarray:
+                return undistorter.undistort(array, pool.acquire(undistorter.output_shape(array)))
+            return undistort
+
+        x, y, w, h, scale = self._region
+        region = x, y, w, h
+
+        def undistort_region(array: np.ndarray) -> RegionFrame:
+            dst = pool.acquire(undistorter.output_shape(array, region, scale))
+            frame = undistorter.undistort_region(array, region, scale, dst).view(RegionFrame)
+            frame.region = x, y, scale
+            return frame
+        return undistort_region
+
+    def _on_raw_frame(self, frame: QVideoFrame):
+        if self._seek_started and frame_timings.enabled:
+            frame_timings.record(self.objectName(), 'seek', self._seek_started)
+        if frame.isValid():
+            self._on_frame_size(frame.width(), frame.height())
+        if self.undistort_frames and not self._playing_proxy:
+            self._process_frame(frame)
+        elif not self._showing_cached:
+            self._display(frame)
+
+    def set_cache_size(self, max_bytes: int):
+        self.frame_cache.set_max_bytes(max_bytes)
+
+    def _process_frame(self, frame: QVideoFrame):
+        if self._processing:
+            self._waiting_frame = frame
+            return
+        self._processing = True
+        self._frame_processor.processVideoFrame(frame)
+
+    def _frame_pos(self, frame: QVideoFrame) -> int | None:
+        """Cache position of a decoded frame of the original video by its own timestamp, None if it has none"""
+        if frame.startTime() < 0:
+            return None
+        # Same as the position a seek to the frame goes to
+        i = self.frame_index.nearest(frame.startTime() / 1000)
+        return ceil(float(self.frame_index.timestamps[i]))
+
+    def _on_frame_processed(self, frame: QVideoFrame, array: np.ndarray, generation: int):
+        # Processed in a previous mode or region, the current frame is redisplayed after every change
+        if generation != self._process_generation:
+            return
+        self._processing = False
+        if self._waiting_frame is not None:
+            waiting, self._waiting_frame = self._waiting_frame, None
+            self._process_frame(waiting)
+
+        # Cached under the frame's own position, a late frame of a previous seek isn't taken for the current one
+        pos = self._frame_pos(frame)
+        if pos is not None and array.size:
+            # Pooled buffers aren't reused while cached, safe to keep
+            self.frame_cache.put(pos, array)
+        # A late frame from a previous seek must not replace the cached one
+        if self._showing_cached:
+            return
+        self._display(frame, array)
+
+    def _on_frame_size(self, width: int, height: int):
+        if self.undistort_frames and not self._playing_proxy and self._undistorter.output_size is not None:
+            size = self._undistorter.output_size
+        else:
+            size = round(width * self._source_pixel_scale), round(height * self._source_pixel_scale)
+        if size != self._frame_size:
+            self._frame_size = size
+            self._region = None
+            self.fit2video()
+            self._viewport_timer.start()
+
     def closeEvent(self, event: QCloseEvent) -> None:
         self._frame_processor.stop()
+        self._prefetcher.stop()
         return super().closeEvent(event)
@@ -0,0 +1,109 @@
+from dataclasses import dataclass
+from itertools import combinations
+
+import numpy as np
+
+from triangulation import MultiTriangulator, closest_points_along_two_lines, fit_rotation, triangulate_rays
+
+# Extra export columns: ray miss distance, 1-sigma semi-axes of the error
+# ellipsoid (largest first) and the unique elements of the ENU covariance
+UNCERTAINTY_HEADERS = (
+    'miss', 'sigma_major', 'sigma_middle', 'sigma_minor',
+    'cov_ee', 'cov_en', 'cov_eu', 'cov_nn', 'cov_nu', 'cov_uu',
+)
+_COV_INDEXES = np.triu_indices(3)
+
+
+@dataclass
+class NoiseModel:
+    """Standard deviations of the inputs of triangulation"""
+    pixel_sigma: float = 1.0  # clicked pixels, px
+    anchor_sigma: float = 1.0  # anchor pixels, px
+    position_sigma: float = 1.0  # camera positions along each ENU axis, m
+    samples: int = 200
+    seed: int | None = 0
+
+
+class UncertaintyEstimator:
+    """Monte Carlo uncertainty of triangulated points.
+
+    Clicked pixels, anchor pixels and camera positions are perturbed with the
+    noise of `noise` and every sample is triangulated. Anchor and camera
+    position errors are systematic, so one set of perturbed camera
+    orientations is drawn per call and shared by all points; only the clicked
+    pixels get independent noise per point. All samples of a chunk of points
+    go through `triangulate_rays` as one batch.
+
+    Cameras are read on every call, so anchor updates are taken into account.
+    """
+    def __init__(self, triangulator: MultiTriangulator, noise: NoiseModel | None = None, max_batch=200_000) -> None:
+        self.triangulator = triangulator
+        self.noise = noise or NoiseModel()
+        # Samples times points triangulated at once, bounds memory use
+        self.max_batch = max_batch
+
+    def estimate(self, *imgs_points_pix) -> np.ndarray:
+        """Uncertainty of N points given by (N, 2) pixels of every camera, NaN for missing.
+
+        Returns (N, len(UNCERTAINTY_HEADERS)) array, rows of points seen by
+        fewer than two cameras are NaN.
+        """
+        pixels = np.stack([np.asarray(p, dtype=float).reshape(-1, 2) for p in imgs_points_pix], axis=1)
+        rng = np.random.default_rng(self.noise.seed)
+        origins, pix2world = self._sample_cameras(rng)
+
+        result = np.full((len(pixels), len(UNCERTAINTY_HEADERS)), np.nan)
+        result[:, 0] = self.miss_distance(pixels)
+        chunk_size = max(1, self.max_batch // self.noise.samples)
+        for i in range(0, len(pixels), chunk_size):
+            result[i:i + chunk_size, 1:] = self._estimate_chunk(rng, origins, pix2world, pixels[i:i + chunk_size])
+        return result
+
+    def _sample_cameras(self, rng: np.random.Generator) -> tuple[np.ndarray, np.ndarray]:
+        """Perturbed camera positions (S, C, 3) and pixel to world direction matrices (S, C, 3, 3)"""
+        noise = self.noise
+        cams = self.triangulator.cams
+        shape = noise.samples, len(cams)
+        position_noise = rng.normal(0, noise.position_sigma, (*shape, 3))
+        origins = self.triangulator.cams_world + position_noise
+
+        pix2world = np.empty((*shape, 3, 3))
+        for c, cam in enumerate(cams):
+            observed = cam.observed_anchors
+            anchors_cam = np.array(cam.anchors_dirvec_cam)[observed]  # (K, 3)
+            anchors_world = np.array(cam.anchors_world)[observed]
+            # Pixel noise moves a direction by K^-1 @ [du, dv, 0]
+            anchor_noise = rng.normal(0, noise.anchor_sigma, (noise.samples, len(observed), 2))
+            anchors_cam = anchors_cam + anchor_noise @ cam.mtx_inv[:, :2].T
+            # Anchors are seen from the moved camera
+            anchors_world = anchors_world - position_noise[:, c, None]
+            anchors_cam /= np.linalg.norm(anchors_cam, axis=-1, keepdims=True)
+            anchors_world /= np.linalg.norm(anchors_world, axis=-1, keepdims=True)
+            pix2world[:, c] = fit_rotation(anchors_cam, anchors_world) @ cam.mtx_inv
+        return origins, pix2world
+
+    def _estimate_chunk(self, rng: np.random.Generator, origins: np.ndarray, pix2world: np.ndarray, pixels: np.ndarray) -> np.ndarray:
+        """Ellipsoid semi-axes and covariance elements (n, 9) of n points"""
+        noisy = pixels + rng.normal(0, self.noise.pixel_sigma, (self.noise.samples, *pixels.shape))
+        # Directions (S, n, C, 3) as columns of the matrices times [u, v, 1], missing pixels stay NaN
+        pix2world = pix2world[:, None]
+        directions = pix2world[..., 0] * noisy[..., :1] + pix2world[..., 1] * noisy[..., 1:] + pix2world[..., 2]
+        world, _ = triangulate_rays(origins[:, None], directions)
+
+        # Sample covariance of every point as a batched (n, 3, S) @ (n, S, 3) product
+        deviations = (world - world.mean(axis=0)).transpose(1, 0, 2)
+        cov = deviations.transpose(0, 2, 1) @ deviations / (len(world) - 1)
+        sigmas = np.full((len(pixels), 3), np.nan)
+        finite = np.isfinite(cov).all(axis=(1, 2))
+        sigmas[finite] = np.sqrt(np.linalg.eigvalsh(cov[finite]).clip(0))[:, ::-1]
+        return np.hstack([sigmas, cov[:, _COV_INDEXES[0], _COV_INDEXES[1]]])
+
+    def miss_distance(self, pixels: np.ndarray) -> np.ndarray:
+        """Largest distance between rays of any two cameras that see the point, (N, C, 2) pixels -> (N,)"""
+        triangulator = self.triangulator
+        directions = [cam.pixels2dirvecs_world(pixels[:, c]) for c, cam in enumerate(triangulator.cams)]
+        miss = np.full(len(pixels), np.nan)
+        for i, j in combinations(range(len(directions)), 2):
+            p1, p2 = closest_points_along_two_lines(triangulator.cams_world[i], triangulator.cams_world[j], directions[i], directions[j])
+            miss = np.fmax(miss, np.linalg.norm(p1 - p2, axis=-1))
+        return miss
@@ -1,13 +1,142 @@
-import cv2 as cv
 import numpy as np
 
+from lazy_import import lazy_import
+
+cv = lazy_import('cv2')
+
 
 class ImageUndistorter:
-    """This class is responsible for eliminating image distortion"""
-    def __init__(self, mtx, distortion_coeffs):
+    """This class is responsible for eliminating image distortion
+
+    Undistortion maps are computed once and reused for every frame. They are
+    rebuilt only when the frame size or the calibration changes.
+
+    `interpolation` is passed to `cv.remap` (e.g. `cv.INTER_NEAREST` is faster,
+    the default `cv.INTER_LINEAR` matches `cv.undistort`). If `alpha` is given, the output
+    camera matrix is computed with `cv.getOptimalNewCameraMatrix`: 0 keeps only
+    valid pixels, 1 keeps all source pixels. With `crop_to_roi` the output is
+    additionally cropped to the valid region. Both change the geometry of the
+    undistorted image, so `output_mtx` must be used for undistorted pixels.
+    """
+    def __init__(self, mtx, distortion_coeffs, interpolation: int | None = None, alpha: float | None = None, crop_to_roi=False):
+        self.interpolation = cv.INTER_LINEAR if interpolation is None else interpolation
+        self.alpha = alpha
+        self.crop_to_roi = crop_to_roi
+        self.set_calibration(mtx, distortion_coeffs)
+
+    def set_calibration(self, mtx, distortion_coeffs):
         self.mtx = mtx
         self.distortion_coeffs = distortion_coeffs
+        # Maps are lazily rebuilt on the next frame
+        self._size = None
+        self._maps = None
+        self._output_mtx = mtx
+        self._output_size = None
+        self._region_maps: dict[tuple, tuple] = {}
+
+    @property
+    def output_mtx(self) -> np.ndarray:
+        """Camera matrix of the undistorted image"""
+        if self.alpha is not None and self._size is None:
+            raise RuntimeError('Output camera matrix depends on frame size, call prepare() first')
+        return self._output_mtx
+
+    @property
+    def output_size(self) -> tuple[int, int] | None:
+        """(width, height) of the undistorted image, None until the first frame"""
+        return self._output_size
+
+    def prepare(self, size: tuple[int, int]):
+        """Build undistortion maps for frames of `size` (width, height)"""
+        if self.alpha is None:
+            new_mtx, roi = self.mtx, (0, 0, *size)
+        else:
+            # Integer calibrations would give an integer matrix
+            mtx = np.asarray(self.mtx, dtype=np.float64)
+            new_mtx, roi = cv.getOptimalNewCameraMatrix(mtx, self.distortion_coeffs, size, self.alpha, size)
+
+        # Fixed-point maps are compact and the fastest to remap with
+        maps = cv.initUndistortRectifyMap(self.mtx, self.distortion_coeffs, None, new_mtx, size, cv.CV_16SC2)
+        self._size = size
+        self._region_maps.clear()
+
+        if self.crop_to_roi:
+            x, y, w, h = roi
+            # Cropped maps remap straight into a contiguous output of the valid region
+            maps = tuple(np.ascontiguousarray(m[y:y + h, x:x + w]) for m in maps)
+            new_mtx = new_mtx.copy()
+            new_mtx[0, 2] -= x
+            new_mtx[1, 2] -= y
+            self._output_size = w, h
+        else:
+            self._output_size = size
+        self._maps = maps
+        self._output_mtx = new_mtx
+
+    def undistort_points(self, points) -> np.ndarray:
+        """Map (N, 2) pixels of the distorted image to pixels of the undistorted one"""
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 1, 2)
+        undistorted = cv.undistortPoints(points, self.mtx, self.distortion_coeffs, P=self.output_mtx)
+        return undistorted.reshape(-1, 2)
+
+    def distort_points(self, points) -> np.ndarray:
+        """Map (N, 2) pixels of the undistorted image to pixels of the distorted one, inverse of `undistort_points`"""
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        normalized = np.column_stack([points, np.ones(len(points))]) @ np.linalg.inv(self.output_mtx).T
+        distorted, _ = cv.projectPoints(normalized, np.zeros(3), np.zeros(3), self.mtx, self.distortion_coeffs)
+        return distorted.reshape(-1, 2)
+
+    def output_shape(self, array: np.ndarray, region: tuple[int, int, int, int] | None = None, scale=1.0) -> tuple[int, ...]:
+        """Shape of the undistorted `array`, or of its `region` resampled by `scale`, e.g. to preallocate `dst`"""
+        if region is None:
+            size = array.shape[1], array.shape[0]
+            if size != self._size:
+                self.prepare(size)
+            w, h = self._output_size
+        else:
+            w, h = _region_size(region, scale)
+        return h, w, *array.shape[2:]
+
+    def undistort(self, array: np.ndarray, dst: np.ndarray | None = None) -> np.ndarray:
+        """Undistorted `array`, written into `dst` of `output_shape(array)` if given"""
+        size = array.shape[1], array.shape[0]
+        if size != self._size:
+            self.prepare(size)
+        return cv.remap(array, *self._maps, self.interpolation, dst=dst)
+
+    def undistort_region(self, array: np.ndarray, region: tuple[int, int, int, int], scale=1.0,
+                         dst: np.ndarray | None = None) -> np.ndarray:
+        """Undistort only `region` (x, y, width, height) of the undistorted image, resampled by `scale`.
+
+        Cost is proportional to the output size, which is written into `dst`
+        of `output_shape(array, region, scale)` if given. Output pixel (j, i) covers
+        undistorted pixels [x + j / scale, x + (j + 1) / scale) horizontally
+        and the same vertically.
+        """
+        size = array.shape[1], array.shape[0]
+        if size != self._size:
+            self.prepare(size)
+
+        key = region, scale
+        maps = self._region_maps.get(key)
+        if maps is None:
+            x, y, w, h = region
+            out_size = _region_size(region, scale)
+            # Shift principal point to the region and scale, keeping pixel centers aligned
+            region_mtx = self._output_mtx.astype(np.float64)
+            region_mtx[0, 2] = scale * (region_mtx[0, 2] - x + 0.5) - 0.5
+            region_mtx[1, 2] = scale * (region_mtx[1, 2] - y + 0.5) - 0.5
+            region_mtx[0, 0] *= scale
+            region_mtx[1, 1] *= scale
+            maps = cv.initUndistortRectifyMap(self.mtx, self.distortion_coeffs, None, region_mtx, out_size, cv.CV_16SC2)
+            # Viewports are few at a time, keep only recent maps
+            if len(self._region_maps) >= 4:
+                self._region_maps.pop(next(iter(self._region_maps)))
+            self._region_maps[key] = maps
+
+        return cv.remap(array, *maps, self.interpolation, dst=dst)
+
 
-    def undistort(self, array: np.ndarray) -> np.ndarray:
-        img_undistorted = cv.undistort(array, self.mtx, self.distortion_coeffs)
-        return img_undistorted
+def _region_size(region: tuple[int, int, int, int], scale: float) -> tuple[int, int]:
+    """(width, height) of `region` resampled by `scale`"""
+    return max(1, round(region[2] * scale)), max(1, round(region[3] * scale))
@@ -1,6 +1,8 @@
 from collections.abc import Sequence
 from datetime import datetime, timedelta
 
+from frame_index import FrameIndex
+
 
 def intersection(starts: Sequence[datetime], durations: Sequence[timedelta]):
     """Find time interval present in all videos"""
@@ -13,3 +15,19 @@ def intersection(starts: Sequence[datetime], durations: Sequence[timedelta]):
         raise AssertionError('Intervals do not intersect')
     
     return start, end
+
+
+def nearest_frames(dt: datetime, starts: Sequence[datetime], indexes: Sequence[FrameIndex]):
+    """Pair frames of all videos nearest to `dt`.
+
+    The first video's frame nearest to `dt` is the reference, the other videos
+    take their frames nearest to it. Returns frame datetimes and the residual
+    time offset (latest minus earliest frame) of the pair.
+    """
+    def frame_dt(start: datetime, index: FrameIndex, target: datetime) -> datetime:
+        pos = (target - start) / timedelta(milliseconds=1)
+        return start + timedelta(milliseconds=index.snap(pos))
+
+    reference = frame_dt(starts[0], indexes[0], dt)
+    frames = [reference] + [frame_dt(start, index, reference) for start, index in zip(starts[1:], indexes[1:])]
+    return frames, max(frames) - min(frames)